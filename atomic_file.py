@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+'''
+This module writes files atomically: the content goes to a uniquely named temporary file next to the
+target, which is flushed to disk and then replaces it, so a crash or a concurrent reader never sees
+a truncated file, and processes writing the same file at once never share a temporary file. It is
+used for the caches, indexes, manifests, checkpoints, reports and calendars written by the other
+scripts.
+Functions:
+    atomic_write_bytes(path, data):
+        Writes bytes to a file atomically.
+    atomic_write_text(path, text, newline):
+        Writes text to a UTF-8 file atomically.
+    atomic_write_json(path, data, **kwargs):
+        Writes a value as JSON to a file atomically.
+'''
+import json
+import os
+import tempfile
+
+# Permissions of the written files: what open() would give them under the process umask, since
+# mkstemp() creates files readable by their owner only
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def _write(path, data, mode, **open_args):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    (fd, tmp_path) = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **open_args) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_bytes(path, data):
+    """
+    Writes bytes to a file atomically, creating its directory if needed.
+    Args:
+        path (str): The file to write.
+        data (bytes): The content.
+    Returns:
+        None
+    """
+    _write(path, data, "wb")
+
+
+def atomic_write_text(path, text, newline=None):
+    """
+    Writes text to a UTF-8 file atomically, creating its directory if needed.
+    Args:
+        path (str): The file to write.
+        text (str): The content.
+        newline (str): Passed to open(); "" writes line endings as they are in the text, e.g. the
+            CRLF of an ICS file.
+    Returns:
+        None
+    """
+    _write(path, text, "w", newline=newline, encoding="utf-8")
+
+
+def atomic_write_json(path, data, **kwargs):
+    """
+    Writes a value as JSON to a file atomically, creating its directory if needed.
+    Args:
+        path (str): The file to write.
+        data: The value to write.
+        **kwargs: Passed to json.dumps(), e.g. indent=1, sort_keys=True.
+    Returns:
+        None
+    """
+    atomic_write_text(path, json.dumps(data, **kwargs))
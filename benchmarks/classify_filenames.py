@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+'''
+Correctness check and micro-benchmark for classifying document filenames.
+Runs every historical link in old_links.json, plus their bare filenames, through the if/elif
+parse_filename() used before the rule tables and through the table-driven classify_filename(),
+checks that both give the same result for every one, prints the classifications that were not
+fully certain, and times both (the new one with its memo cache cleared, and warm).
+Usage:
+    python benchmarks/classify_filenames.py [repeats]
+'''
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pdf_2_ics import classify_filename, parse_filename  # noqa: E402
+
+
+def legacy_parse_filename(filename):
+    """
+    The parse_filename() implementation before the rule tables.
+    """
+    if "Carb" in filename:
+        return False
+    if "Achievement" in filename:
+        return False
+
+    if "Spanish" in filename:
+        language = "es"
+    else:
+        language = "en"
+    
+    if "K12" in filename:
+        level = "k12"
+    elif "K-12" in filename:
+        level = "k12"
+    elif "ES" in filename:
+        level = "elementary"
+    elif "Elementary" in filename:
+        level = "elementary"
+    elif "Primaria" in filename:
+        level = "elementary"
+    elif "MS" in filename:
+        level = "middle"
+    elif "Intermedia" in filename:
+        level = "middle"
+    elif "Middle" in filename:
+        level = "middle"
+    elif "HS" in filename:
+        level = "high"
+    elif "Secundaria" in filename:
+        level = "high"
+    elif "High" in filename:
+        level = "high"
+    elif "BIC" in filename:
+        level = "bic"
+    elif "Aula" in filename:
+        level = "bic"
+    elif "Classroom" in filename:
+        level = "bic"
+    elif "After" in filename:
+        level = "k12"
+    elif "Aula" in filename:
+        level = "bic"
+    elif "PreK" in filename:
+        level = "prek"
+    elif "Pre-K" in filename:
+        level = "prek"
+    elif "Prek" in filename:
+        level = "prek"
+    elif "Breakfast" in filename:
+        level = "k12"
+    else:
+        return False
+
+    if "Breakfast" in filename:
+        meal = "breakfast"
+    elif "Desayuno" in filename:
+        meal = "breakfast"
+        language = "es"
+    elif "Lunch" in filename:
+        meal = "lunch"
+    elif "Almuerzo" in filename:
+        meal = "lunch"
+        language = "es"
+    elif "Escuela-Primaria" in filename:
+        meal = "lunch"
+        language = "es"
+    elif "ASSP" in filename:
+        meal = "afterschoolsnack"
+        language = "en"
+    elif "After" in filename:
+        meal = "afterschoolsnack"
+    elif "Despu" in filename:
+        meal = "afterschoolsnack"
+        language = "es"
+    elif "Snack" in filename:
+        meal = "snack"
+    elif "Merienda" in filename:
+        meal = "snack"
+        language = "es"
+    else:
+        return False
+
+    if "Spanish" in filename:
+        language = "es"
+
+    return (level, language, meal)
+
+
+def corpus():
+    """
+    Returns the links in old_links.json and their filenames.
+    """
+    with open(os.path.join(ROOT, "old_links.json"), "r", encoding="utf-8") as f:
+        links = json.load(f)
+    return links + [link.rsplit("/", 1)[-1] for link in links]
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    filenames = corpus()
+    mismatches = [name for name in filenames if legacy_parse_filename(name) != parse_filename(name)]
+    for name in mismatches:
+        print(f"mismatch: {name}: {legacy_parse_filename(name)} != {parse_filename(name)}")
+    for name in sorted(set(link.rsplit("/", 1)[-1] for link in filenames)):
+        result = classify_filename(name)
+        if result.confidence < 1.0:
+            print(f"{result.confidence:.1f} {name}: {result.reason}")
+
+    def cold():
+        classify_filename.cache_clear()
+        for name in filenames:
+            parse_filename(name)
+
+    def legacy():
+        for name in filenames:
+            legacy_parse_filename(name)
+
+    def warm():
+        for name in filenames:
+            parse_filename(name)
+
+    for label, run in (("legacy", legacy), ("rules, cold", cold), ("rules, warm", warm)):
+        seconds = timeit.timeit(run, number=repeats) / repeats
+        print(f"{label:>12}: {seconds * 1e6 / len(filenames):6.2f} us/filename, {len(filenames) / seconds:10.0f} filenames/s")
+    sys.exit(1 if mismatches else 0)
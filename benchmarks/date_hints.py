@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+'''
+Correctness check for the month and year read from menu filenames (document_date_hint()) and for
+picking the year of menu dates from them (resolve_menu_dates()).
+Checks the hint of filenames of past menus from old_links.json, and of variants of them with the
+day-and-year forms seen on other menus, against the expected (year, month); reports every link in
+old_links.json whose filename holds a month and a year but gets no hint; and checks that the dates
+of a month of school days land in the right year with a hint that is right, two years off, or
+missing.
+Usage:
+    python benchmarks/date_hints.py
+'''
+import calendar
+import json
+import os
+import re
+import sys
+from datetime import date
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pdf_2_ics import document_date_hint, document_name, resolve_menu_dates  # noqa: E402
+
+# (filename or link, listing URL, expected hint)
+CASES = [
+    ("DPS_PreK_Whitted_Breakfast_Apr25.pdf", None, (2025, 4)),
+    ("Octubre__24_6-8_Menus_de_Almuerzo.pdf", None, (2024, 10)),
+    ("Noviembre_24_9-12_Menus_de_Almuerzo.pdf", None, (2024, 11)),
+    ("DPS-K12-Meriendas-Despues-de-ClasesMay26-Spanish.pdf", None, (2026, 5)),
+    ("https://files-backend.assets.thrillshare.com/documents/asset/uploaded_file/5035/Dps/1fe71770-b524-4f69-"
+     "8966-b77c46688ae0/DPS-K12-Meriendas-Despues-de-ClasesMay26-Spanish.pdf?disposition=inline", None, (2026, 5)),
+    # no year in the filename: the folder of the listing page, or nothing
+    ("Whitted-Pre-K-Lunch---October.pdf", "https://www.dpsnc.net/menus/october-2025/", (2025, 10)),
+    ("Whitted-Pre-K-Lunch---October.pdf", None, None),
+    ("Septiembre_Almuerzo_de_CMA.pdf", None, None),
+    # a day that is not a year, and a day before the year
+    ("Enero_15_Almuerzo-Escuela-Primaria.pdf", None, None),
+    ("Elementary-School-Lunch---January_20_2026.pdf", None, (2026, 1)),
+    ("High-School-Lunch---May-4-26.pdf", None, (2026, 5)),
+    # month names inside other words
+    ("Primary25_Lunch.pdf", None, None),
+    ("DPS_HS_Lunch_Sept24.pdf", None, (2024, 9)),
+]
+# A month name, whole or abbreviated, next to a four-digit year or a two-digit one, in a filename
+YEAR_PATTERN = re.compile(r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|ene|abr|ago|dic)[a-z]*[-_ ]*(20)?[2-3]\d(?!\d)",
+                          re.IGNORECASE)
+
+
+def school_days(year, month):
+    """
+    Returns the (month, day) of every school day of a month, Monday to Friday.
+    """
+    return [(month, day) for day in range(1, calendar.monthrange(year, month)[1] + 1)
+            if date(year, month, day).weekday() < 5]
+
+
+if __name__ == "__main__":
+    failures = 0
+    for name, listing_url, expected in CASES:
+        hint = document_date_hint(name, listing_url)
+        if hint != expected:
+            failures += 1
+            print(f"FAILED: {document_name(name)} ({listing_url}): {hint}, expected {expected}")
+    with open(os.path.join(ROOT, "old_links.json"), "r", encoding="utf-8") as f:
+        links = json.load(f)
+    missed = [link for link in links if document_date_hint(link) is None and YEAR_PATTERN.search(document_name(link))]
+    for link in missed:
+        failures += 1
+        print(f"FAILED: no hint for {document_name(link)}")
+    print(f"{sum(1 for link in links if document_date_hint(link) is None)} of {len(links)} links in "
+          f"old_links.json have no month and year in their filename")
+    for hint in ((2026, 5), (2024, 5), None):
+        dates = resolve_menu_dates(school_days(2026, 5), hint, today=date(2026, 5, 1))
+        if any(day.year != 2026 for day in dates):
+            failures += 1
+            print(f"FAILED: May 2026 menu with hint {hint} resolved to {sorted(set(day.year for day in dates))}")
+    print(f"{len(CASES)} filenames, {failures} failures")
+    sys.exit(1 if failures else 0)
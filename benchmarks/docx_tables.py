@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+'''
+Correctness check and micro-benchmark for extracting the tables of DOCX menus.
+Runs every DOCX document of the benchmark corpus (see benchmarks/pipeline.py snapshot) through the
+python-docx table walk used before and through the streaming iter_docx_tables(), checks that both
+give the same text once the repeated merged cells of python-docx's row.cells are dropped, and times
+both. Needs python-docx, which pdf_2_ics itself no longer uses.
+Usage:
+    python benchmarks/docx_tables.py [repeats]
+'''
+import json
+import os
+import sys
+import timeit
+from io import BytesIO
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+sys.path.insert(0, ROOT)
+
+import docx  # noqa: E402
+
+from pdf_2_ics import iter_docx_tables  # noqa: E402
+
+
+def legacy_tables(data):
+    """
+    The DOCX branch of iter_document_text() before the streaming walker.
+    """
+    doc = docx.Document(BytesIO(data))
+    return ["".join(cell.text + "\n" for row in table.rows for cell in row.cells) for table in doc.tables]
+
+
+def legacy_tables_unique(data):
+    """
+    The python-docx walk with every merged cell kept once, which iter_docx_tables() should match.
+    """
+    doc = docx.Document(BytesIO(data))
+    tables = []
+    for table in doc.tables:
+        # the set holds the w:tc elements themselves, keeping their lxml proxies alive: the proxies
+        # of elements no longer referenced are freed, and their ids reused for other cells
+        seen = set()
+        texts = []
+        for row in table.rows:
+            for cell in row.cells:
+                if cell._tc not in seen:
+                    seen.add(cell._tc)
+                    texts.append(cell.text + "\n")
+        tables.append("".join(texts))
+    return tables
+
+
+def corpus():
+    """
+    Returns the name and content of every DOCX document in the corpus.
+    """
+    with open(os.path.join(CORPUS, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    documents = []
+    for entry in sorted(manifest.values(), key=lambda entry: entry["file"]):
+        if entry["file"].endswith(".docx"):
+            with open(os.path.join(CORPUS, entry["file"]), "rb") as f:
+                documents.append((entry["file"], f.read()))
+    return documents
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    documents = corpus()
+    mismatches = [name for name, data in documents if legacy_tables_unique(data) != list(iter_docx_tables(data))]
+    for name in mismatches:
+        print(f"mismatch: {name}")
+    repeated = sum(len("".join(legacy_tables(data))) - len("".join(legacy_tables_unique(data)))
+                   for _, data in documents)
+    print(f"{len(documents)} documents, {repeated} characters of repeated merged cells dropped")
+
+    def legacy():
+        for _, data in documents:
+            legacy_tables(data)
+
+    def streaming():
+        for _, data in documents:
+            list(iter_docx_tables(data))
+
+    for label, run in (("python-docx", legacy), ("iterparse", streaming)):
+        seconds = timeit.timeit(run, number=repeats) / repeats
+        print(f"{label:>12}: {seconds * 1e3 / max(len(documents), 1):7.2f} ms/document")
+    sys.exit(1 if mismatches else 0)
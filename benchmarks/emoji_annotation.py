@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark for adding emojis to menu lines.
+Runs a year of synthetic menus (the same dishes repeat from month to month, as they do on the real
+menus) through the emoji.emojize() based annotation add_emojis() used to do, and through the cached
+EmojiAnnotator, then prints both timings and the annotator's cache hit rates.
+Needs the WordNet corpus (python setup.py).
+Usage:
+    python benchmarks/emoji_annotation.py [months]
+'''
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import emoji  # noqa: E402
+from nltk.stem import WordNetLemmatizer  # noqa: E402
+
+from pdf_2_ics import EmojiAnnotator  # noqa: E402
+
+DISHES = {
+    "en": ["Chicken Nuggets", "Whole Grain Roll", "Steamed Broccoli", "Fresh Apple", "Milk",
+           "Cheese Pizza", "Garden Salad", "Banana", "Hot Dog", "Baked Beans", "Tacos", "Corn",
+           "Pancakes", "Orange Juice", "Cereal", "Strawberry Yogurt", "Grilled Cheese Sandwich"],
+    "es": ["Nuggets de Pollo", "Pan Integral", "Brócoli al Vapor", "Manzana Fresca", "Leche",
+           "Pizza de Queso", "Ensalada", "Plátano", "Perro Caliente", "Frijoles", "Tacos", "Maíz",
+           "Panqueques", "Jugo de Naranja", "Cereal", "Yogur de Fresa", "Sándwich de Queso"],
+}
+
+
+def legacy_add_emojis(next_line, language, wnl):
+    """
+    The add_emojis() implementation before EmojiAnnotator.
+    """
+    next_line_no_colons = re.sub(r":", r"", next_line)
+    lemmatized_string = " ".join([wnl.lemmatize(words) for words in next_line_no_colons.lower().split()])
+    with_colons = re.sub(r"(\w*)", r":\1:", lemmatized_string)
+    with_emojis = emoji.emojize(string=with_colons, language="alias" if language == "en" else language)
+    return next_line_no_colons + "".join([c for c in with_emojis if c in emoji.EMOJI_DATA])
+
+
+def menu_lines(language, months):
+    """
+    Returns the description lines of a number of months of menus, 22 days of 5 dishes each.
+    """
+    dishes = DISHES[language]
+    return [dishes[(month + day * 5 + dish) % len(dishes)]
+            for month in range(months) for day in range(22) for dish in range(5)]
+
+
+if __name__ == "__main__":
+    months = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    wnl = WordNetLemmatizer()
+    for language in ("en", "es"):
+        lines = menu_lines(language, months)
+        start = time.perf_counter()
+        before = [legacy_add_emojis(line, language, wnl) for line in lines]
+        legacy_seconds = time.perf_counter() - start
+
+        annotator = EmojiAnnotator()
+        start = time.perf_counter()
+        after = [annotator.annotate(line, language, wnl) for line in lines]
+        annotator_seconds = time.perf_counter() - start
+
+        assert before == after
+        lemma_calls = annotator.stats["lemma_hits"] + annotator.stats["lemma_misses"]
+        print(f"{language}: {len(lines)} lines, before {legacy_seconds * 1e3:7.1f} ms, "
+              f"after {annotator_seconds * 1e3:7.1f} ms (including building the lookup table), "
+              f"line hit rate {annotator.hit_rate():.1%}, "
+              f"lemma hit rate {annotator.stats['lemma_hits'] / max(lemma_calls, 1):.1%}")
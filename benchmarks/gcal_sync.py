@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+'''
+Correctness check for bringing a Google Calendar in line with an ICS file (gcal.diff_events()).
+Syncs a week of menus with process_content() into a fake Calendar API service that already holds:
+an event created before content hashes were stored, with the same content (adopted: only its hash
+is backfilled) and one with a changed menu (patched in place); an up-to-date event (left alone); a
+stale menu event on a day the file no longer has and a duplicate of an up-to-date day (deleted);
+menu events before and after the span of the file and an event not created by gcal.py inside it
+(left alone). The sync runs once listing the events of the span and once through the sync index,
+and checks the requests sent, the calendar left behind, that syncing again sends nothing and
+that the API calls are counted under the calendar's name.
+diff_events() is also run on its own with the events outside the span in its input, as a wider
+listing would return them. Needs the packages of gcal.py, but no credentials or network.
+Usage:
+    python benchmarks/gcal_sync.py
+'''
+import copy
+import os
+import sys
+import tempfile
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# no synced manifest, so every run syncs, and no rate limiting against the fake service
+os.environ["GCAL_SYNCED_MANIFEST"] = ""
+os.environ["GCAL_MAX_QPS"] = "1000000"
+
+import gcal  # noqa: E402
+from menu_calendar import MenuEvent, serialize_events  # noqa: E402
+
+CALENDAR = "english_k12_lunch.ics"
+CAL_ID = "k12-lunch@group.calendar.google.com"
+SUMMARY = "K12 Lunch"
+# The menus of the ICS file; Thursday May 7 has no menu any more
+MENUS = {
+    date(2026, 5, 4): "Cheese Pizza\nGarden Salad",
+    date(2026, 5, 5): "Beef Burrito\nBrown Rice",
+    date(2026, 5, 6): "Hot Dog\nCorn",
+    date(2026, 5, 8): "Chicken Sandwich\nBananas",
+}
+
+
+class FakeRequest:
+    """
+    An unexecuted API request; executing it applies it to the fake calendar.
+    """
+
+    def __init__(self, function, **kwargs):
+        self.function = function
+        self.kwargs = kwargs
+
+    def execute(self):
+        return self.function(**self.kwargs)
+
+
+class FakeBatch:
+    """
+    An HTTP batch of requests, answered through its callback as the API does.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        for request_id, request in self.requests:
+            self.callback(request_id, request.execute(), None)
+
+
+class FakeService:
+    """
+    The events of one calendar behind the parts of the Calendar API that gcal.py calls. Every
+    change is logged, so listings with a sync token return the events changed since it was issued.
+    """
+
+    def __init__(self, events):
+        self.events_by_id = {event["id"]: copy.deepcopy(event) for event in events}
+        self.changes = []
+        self.calls = []
+        self.next_id = 0
+
+    def events(self):
+        return self
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(callback)
+
+    def list(self, calendarId, **kwargs):
+        return FakeRequest(self._list, **kwargs)
+
+    def insert(self, calendarId, body):
+        return FakeRequest(self._insert, body=body)
+
+    def patch(self, calendarId, eventId, body):
+        return FakeRequest(self._patch, event_id=eventId, body=body)
+
+    def delete(self, calendarId, eventId):
+        return FakeRequest(self._delete, event_id=eventId)
+
+    def _changed(self, event):
+        self.changes.append(copy.deepcopy(event))
+        return copy.deepcopy(event)
+
+    def _list(self, timeMin=None, timeMax=None, syncToken=None, pageToken=None, **kwargs):
+        if syncToken is not None:
+            items = self.changes[int(syncToken):]
+        else:
+            items = [copy.deepcopy(event) for event in self.events_by_id.values()]
+        if timeMin is not None:
+            items = [event for event in items
+                     if event["start"]["date"] <= timeMax[:10] and event["end"]["date"] > timeMin[:10]]
+        return {"items": items, "nextSyncToken": str(len(self.changes))}
+
+    def _insert(self, body):
+        self.calls.append(("insert", body["start"]["date"]))
+        self.next_id += 1
+        event = dict(copy.deepcopy(body), id="new%d" % self.next_id)
+        self.events_by_id[event["id"]] = event
+        return self._changed(event)
+
+    def _patch(self, event_id, body):
+        self.calls.append(("patch", event_id))
+        self.events_by_id[event_id].update(copy.deepcopy(body))
+        return self._changed(self.events_by_id[event_id])
+
+    def _delete(self, event_id):
+        self.calls.append(("delete", event_id))
+        event = self.events_by_id.pop(event_id)
+        self._changed(dict(event, status="cancelled"))
+        return ""
+
+
+def calendar_event(event_id, day, description, summary=SUMMARY, hashed=True):
+    """
+    Returns an all-day event as the API returns it, with a content hash unless hashed is False.
+    """
+    event = {"id": event_id, "summary": summary, "description": description,
+             "start": {"date": day.isoformat()}, "end": {"date": date.fromordinal(day.toordinal() + 1).isoformat()}}
+    if hashed:
+        event["extendedProperties"] = {"private": {gcal.CONTENT_HASH_KEY: gcal.content_hash(event)}}
+    return event
+
+
+def existing_events():
+    """
+    Returns the events in the calendar before the sync.
+    """
+    return [
+        calendar_event("legacy", date(2026, 5, 4), MENUS[date(2026, 5, 4)], hashed=False),
+        calendar_event("legacy-changed", date(2026, 5, 5), "Beef Tacos\nBrown Rice", hashed=False),
+        calendar_event("current", date(2026, 5, 6), MENUS[date(2026, 5, 6)]),
+        calendar_event("duplicate", date(2026, 5, 6), "Hot Dog"),
+        calendar_event("stale", date(2026, 5, 7), "Grilled Cheese\nVegetable Soup"),
+        calendar_event("before", date(2026, 4, 30), "Fresh Apples"),
+        calendar_event("after", date(2026, 5, 11), "Fresh Grapes"),
+        calendar_event("foreign", date(2026, 5, 5), "Field trip", summary="Field Day", hashed=False),
+    ]
+
+
+def check(failures, name, actual, expected):
+    """
+    Prints the outcome of one check and records it if it failed.
+    """
+    if actual == expected:
+        print(f"ok: {name}")
+    else:
+        failures.append(name)
+        print(f"FAILED: {name}\n  expected: {expected}\n  actual:   {actual}")
+
+
+def check_sync(failures, label):
+    """
+    Syncs the ICS file into a fresh fake calendar twice and checks the requests and the result.
+    """
+    content = serialize_events([MenuEvent(SUMMARY, day, menu) for day, menu in MENUS.items()],
+                               calendar=CALENDAR)
+    service = FakeService(existing_events())
+    gcal.process_content({CALENDAR: CAL_ID}, service, CALENDAR, content)
+    calls = sorted(service.calls)
+    check(failures, f"{label}: legacy event adopted by backfilling its hash", ("patch", "legacy") in calls
+          and service.events_by_id["legacy"]["description"] == MENUS[date(2026, 5, 4)]
+          and gcal.CONTENT_HASH_KEY in service.events_by_id["legacy"]["extendedProperties"]["private"], True)
+    check(failures, f"{label}: changed legacy event patched in place",
+          service.events_by_id["legacy-changed"]["description"], MENUS[date(2026, 5, 5)])
+    check(failures, f"{label}: unchanged event skipped",
+          [call for call in calls if call[1] in ("current", "2026-05-06")], [])
+    check(failures, f"{label}: stale events inside the span deleted",
+          [call for call in calls if call[0] == "delete"], [("delete", "duplicate"), ("delete", "stale")])
+    check(failures, f"{label}: events outside the span and foreign events left alone",
+          [call for call in calls if call[1] in ("before", "after", "foreign")]
+          + [event_id for event_id in ("before", "after", "foreign") if event_id not in service.events_by_id], [])
+    check(failures, f"{label}: missing day inserted", [call for call in calls if call[0] == "insert"],
+          [("insert", "2026-05-08")])
+    menus = sorted((event["start"]["date"], event["description"]) for event in service.events_by_id.values()
+                   if event["summary"] == SUMMARY and "2026-05-04" <= event["start"]["date"] <= "2026-05-08")
+    check(failures, f"{label}: calendar matches the file", menus,
+          sorted((day.isoformat(), menu) for day, menu in MENUS.items()))
+    service.calls = []
+    gcal.process_content({CALENDAR: CAL_ID}, service, CALENDAR, content)
+    check(failures, f"{label}: syncing again sends nothing", service.calls, [])
+    check(failures, f"{label}: API calls counted for the calendar", sorted(
+        set(labels.get("calendar") for name, labels, value in gcal.metrics.get_metrics().snapshot()["counters"]
+            if name == "api_calls")), [CALENDAR])
+
+
+if __name__ == "__main__":
+    failures = []
+    bodies = [gcal.event_body(MenuEvent(SUMMARY, day, menu)) for day, menu in MENUS.items()]
+    (inserts, patches, deletes) = gcal.diff_events(bodies, existing_events())
+    check(failures, "diff_events: inserts", [body["start"]["date"] for body in inserts], ["2026-05-08"])
+    check(failures, "diff_events: patches", sorted(event_id for event_id, body in patches),
+          ["legacy", "legacy-changed"])
+    check(failures, "diff_events: hash-only patch for the unchanged legacy event",
+          dict(patches)["legacy"], {"extendedProperties": bodies[0]["extendedProperties"]})
+    check(failures, "diff_events: deletes", sorted(deletes), ["duplicate", "stale"])
+
+    gcal.SYNC_INDEX_JSON = ""
+    check_sync(failures, "listing")
+    with tempfile.TemporaryDirectory() as directory:
+        (gcal.SYNC_INDEX_JSON, gcal._sync_index) = (os.path.join(directory, "gcal_sync_index.json"), None)
+        check_sync(failures, "sync index")
+    print(f"{len(failures)} failures")
+    sys.exit(1 if failures else 0)
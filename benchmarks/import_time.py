@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+'''
+Import-time benchmark for pdf_2_ics.
+Imports the module in fresh interpreters, reports the best wall time, and fails if any of the
+heavy libraries that are only needed once there are new menus to parse gets imported eagerly.
+Usage:
+    python benchmarks/import_time.py [repeats]
+'''
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# Libraries pdf_2_ics must not import at module level
+DEFERRED = ("emoji", "bs4", "nltk", "pypdf", "docx")
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import pdf_2_ics
+print(time.perf_counter() - start)
+print(",".join(name for name in %r if name in sys.modules))
+""" % (DEFERRED,)
+
+
+def measure():
+    """
+    Returns the import time in seconds and the deferred libraries that were imported anyway.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    return float(output[0]), [name for name in output[1].split(",") if name]
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = [measure() for _ in range(repeats)]
+    best = min(seconds for seconds, _ in results)
+    eager = sorted(set(name for _, names in results for name in names))
+    print(f"import pdf_2_ics: best of {repeats}: {best * 1e3:.1f} ms")
+    if eager:
+        print(f"imported eagerly: {', '.join(eager)}")
+        sys.exit(1)
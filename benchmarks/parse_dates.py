@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+'''
+Micro-benchmark for splitting menu text into days.
+Compares the previous approach, which called is_valid_date() and parse_date_string() on every line
+and again on every look-ahead line while rebuilding the pattern and month list each time, with the
+single-pass iter_menu_days(). Both run on the same synthetic month of menus, and their output is
+checked to be identical before timing.
+Usage:
+    python benchmarks/parse_dates.py [repeats]
+'''
+import os
+import re
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_2_ics import MONTH_NAMES, STOP_WORDS, iter_menu_days  # noqa: E402
+
+
+def legacy_parse_date_string(date_string, language):
+    """
+    The parse_date_string() implementation before the patterns were precompiled.
+    """
+    if language == "es":
+        pattern = r"^(Enero|Febrero|Marzo|Abril|Mayo|Junio|Julio|Agosto|Septiembre|Octubre|Noviembre|Diciembre)\s+(\d{1,2})$"
+    else:
+        pattern = r"^(January|February|March|April|May|June|July|August|September|October|November|December)\s+(\d{1,2})$"
+    match = re.match(pattern, date_string)
+    if not match:
+        return None
+    month_names = list(MONTH_NAMES.get(language, []))
+    if not month_names:
+        return None
+    return datetime.now().year, month_names.index(match.group(1)) + 1, int(match.group(2))
+
+
+def legacy_menu_days(lines, day_language):
+    """
+    The look-ahead loop text_to_ics() used before iter_menu_days(), minus the event building.
+    """
+    days = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if legacy_parse_date_string(line.strip(), day_language) is None:
+            i += 1
+            continue
+        date_parts = legacy_parse_date_string(line.strip(), day_language)
+        description = []
+        while (
+            i + 1 < len(lines)
+            and legacy_parse_date_string(lines[i + 1].strip(), day_language) is None
+            and not any(word in lines[i + 1] for word in STOP_WORDS)
+        ):
+            description.append(lines[i + 1].strip())
+            i += 1
+        days.append((date_parts, description))
+    return days
+
+
+def sample_menu(language):
+    """
+    Builds the text of a month of menus, shaped like what url_to_text() returns.
+    """
+    month = MONTH_NAMES[language][4]
+    lines = ["Durham Public Schools", "Menu"]
+    for day in range(1, 23):
+        lines.append(f"{month} {day}")
+        lines += ["Chicken Nuggets", "Whole Grain Roll", "Steamed Broccoli", "Fresh Apple", "Milk"]
+    lines += ["Prices: $1.00", "Menu subject to change"]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for language in ("en", "es"):
+        lines = sample_menu(language).split("\n")
+        assert legacy_menu_days(lines, language) == list(iter_menu_days(lines, language))
+        before = timeit.timeit(lambda: legacy_menu_days(lines, language), number=repeats) / repeats
+        after = timeit.timeit(lambda: list(iter_menu_days(lines, language)), number=repeats) / repeats
+        print(f"{language}: before {before * 1e6:8.1f} us/document, after {after * 1e6:8.1f} us/document, "
+              f"{before / after:4.1f}x faster")
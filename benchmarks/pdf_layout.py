@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+'''
+Correctness check for reading PDF menus from the layout of the calendar grid (DPS_PDF_LAYOUT).
+Reads every PDF in benchmarks/fixtures (synthetic grids with left-aligned, centered and right-aligned
+dates, see benchmarks/synthetic_menus.py) and in the benchmark corpus (see benchmarks/pipeline.py
+snapshot) both as flat text and cell by cell, splits each into days with iter_menu_days(), and
+reports every document where the two disagree on the date or the menu of a day. Blank lines at the
+end of a day are not compared: flat text ends the last day of a page at the footnote, while layout
+mode leaves the footnote out and ends it with the blank line after the page, so turning layout mode
+on adds a line break to the description of those days. Layout mode should only be turned on by
+default once this passes on the real menus.
+Usage:
+    python benchmarks/pdf_layout.py
+'''
+import glob
+import json
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+sys.path.insert(0, ROOT)
+
+import pdf_2_ics  # noqa: E402
+
+
+def documents():
+    """
+    Returns the path of every PDF fixture and corpus document.
+    """
+    paths = sorted(glob.glob(os.path.join(FIXTURES, "*.pdf")))
+    manifest_path = os.path.join(CORPUS, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        paths += sorted(os.path.join(CORPUS, entry["file"]) for entry in manifest.values()
+                        if entry["file"].endswith(".pdf"))
+    return paths
+
+
+def read_days(path, layout):
+    """
+    Returns the days of a PDF menu, in every supported language, read as flat text or from its layout.
+    Returns:
+        dict: The list of (date, description lines) blocks from iter_menu_days(), by language.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    pdf_2_ics.PDF_LAYOUT = layout
+    text = pdf_2_ics.document_to_text(path, data)
+    return {language: [(date_parts, trim_blank_lines(description))
+                       for date_parts, description in pdf_2_ics.iter_menu_days(text.split("\n"), language)]
+            for language in pdf_2_ics.MONTH_NAMES}
+
+
+def trim_blank_lines(lines):
+    """
+    Returns the lines without the blank ones at the end.
+    """
+    end = len(lines)
+    while end and not lines[end - 1]:
+        end -= 1
+    return lines[:end]
+
+
+if __name__ == "__main__":
+    mismatches = 0
+    for path in documents():
+        (flat, layout) = (read_days(path, False), read_days(path, True))
+        if flat == layout:
+            print(f"ok: {os.path.relpath(path, ROOT)}")
+            continue
+        mismatches += 1
+        print(f"mismatch: {os.path.relpath(path, ROOT)}")
+        for language in flat:
+            for flat_day, layout_day in zip(flat[language], layout[language]):
+                if flat_day != layout_day:
+                    print(f"  flat:   {flat_day}\n  layout: {layout_day}")
+                    break
+            if len(flat[language]) != len(layout[language]):
+                print(f"  {len(flat[language])} days flat, {len(layout[language])} days from the layout")
+    print(f"{mismatches} mismatches")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+'''
+End-to-end benchmark of the pdf_2_ics pipeline on a corpus of real past menus.
+The corpus is a local snapshot of the documents listed in old_links.json, kept in benchmarks/corpus
+with a manifest.json mapping each original URL to its file. The run command serves it from a local
+HTTP server standing in for S3, pushes every document through fetch_document(), document_to_text(),
+text_to_events() (with add_emojis() timed on its own) and serialize_events(), times parse_filename() over all
+links, and reports per-stage timings, documents/sec, events/sec and peak RSS. The ICS output of each
+document is compared with its golden file in benchmarks/corpus/golden, ignoring UIDs, timestamps and
+event order; the run fails if any differ or is missing, unless --update-golden rewrites them.
+The corpus checked into the repository holds synthetic menus in the DPS layouts (written by
+benchmarks/synthetic_menus.py corpus, and marked "synthetic" in the manifest), so the run works from a
+clean checkout; benchmarks/synthetic_menus.py check compares their golden files with the dates and
+dishes they were drawn with. The snapshot command adds the real menus next to them.
+Needs the WordNet corpus (python setup.py), and network access for the snapshot command only.
+Usage:
+    python benchmarks/pipeline.py snapshot [limit]
+    python benchmarks/pipeline.py run [--update-golden]
+'''
+import difflib
+import functools
+import hashlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+GOLDEN = os.path.join(CORPUS, "golden")
+MANIFEST = os.path.join(CORPUS, "manifest.json")
+
+# the benchmark must measure the network path, not the document cache
+os.environ["DPS_CACHE_DIR"] = ""
+sys.path.insert(0, ROOT)
+
+import pdf_2_ics  # noqa: E402
+
+
+def local_name(url):
+    """
+    Returns the corpus filename of a document: its S3 asset ID and original name, e.g. 5139744_DPS_K12_Lunch_Apr25.pdf.
+    """
+    parts = urlparse(url).path.split("/")
+    return f"{parts[-2]}_{parts[-1]}"
+
+
+def snapshot(limit=None):
+    """
+    Downloads the documents in old_links.json into the corpus and writes the manifest.
+    Documents already in the corpus are kept. Links that cannot be downloaded any more are skipped.
+    """
+    with open(os.path.join(ROOT, "old_links.json"), "r", encoding="utf-8") as f:
+        links = [link for link in json.load(f) if link.endswith(".pdf") or link.endswith(".docx")]
+    manifest = {}
+    if os.path.exists(MANIFEST):
+        with open(MANIFEST, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    os.makedirs(CORPUS, exist_ok=True)
+    for link in links[:limit]:
+        name = local_name(link)
+        path = os.path.join(CORPUS, name)
+        if link in manifest and os.path.exists(path):
+            continue
+        try:
+            response = pdf_2_ics.get_session().get(link, timeout=pdf_2_ics.REQUEST_TIMEOUT)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"skipped {link}: {e}")
+            continue
+        with open(path, "wb") as f:
+            f.write(response.content)
+        manifest[link] = {"file": name, "sha256": hashlib.sha256(response.content).hexdigest()}
+        print(name)
+    with open(MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    print(f"{len(manifest)} documents in {CORPUS}")
+
+
+def serve_corpus():
+    """
+    Serves the corpus directory over HTTP on a free local port, from a daemon thread.
+    Returns:
+        str: The base URL of the server.
+    """
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=CORPUS))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def normalize_ics(ics_string):
+    """
+    Returns the events of a serialized calendar as sorted blocks of lines, without the lines
+    that change from run to run (UID, DTSTAMP), so two runs on the same document compare equal.
+    """
+    events, current = [], None
+    for line in ics_string.splitlines():
+        if line == "BEGIN:VEVENT":
+            current = [line]
+        elif current is not None:
+            if not line.startswith(("UID:", "DTSTAMP:")):
+                current.append(line)
+            if line == "END:VEVENT":
+                events.append("\n".join(current))
+                current = None
+    return "\n".join(sorted(events)) + "\n"
+
+
+def run(update_golden=False):
+    """
+    Runs the corpus through the pipeline and prints the report.
+    Returns:
+        int: The number of documents whose output differs from its golden file, or has none.
+    """
+    with open(MANIFEST, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    base_url = serve_corpus()
+    timings = dict.fromkeys(("parse_filename", "fetch", "extract", "events", "add_emojis", "serialize"), 0.0)
+    documents = events = downloaded = mismatches = 0
+
+    # time add_emojis() apart from the rest of text_to_events(), which looks it up at call time
+    original_add_emojis = pdf_2_ics.add_emojis
+
+    def timed_add_emojis(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_add_emojis(*args, **kwargs)
+        finally:
+            timings["add_emojis"] += time.perf_counter() - start
+
+    pdf_2_ics.add_emojis = timed_add_emojis
+
+    start = time.perf_counter()
+    targets = {link: pdf_2_ics.parse_filename(link) for link in manifest}
+    timings["parse_filename"] = time.perf_counter() - start
+
+    os.makedirs(GOLDEN, exist_ok=True)
+    for link, entry in sorted(manifest.items()):
+        params = targets[link]
+        target = params and pdf_2_ics.menu_target(*params)
+        if not target:
+            continue
+        (level, language, meal) = params
+        (event_title, _) = target
+        url = base_url + quote(entry["file"])
+
+        start = time.perf_counter()
+        data = pdf_2_ics.fetch_document(url)
+        timings["fetch"] += time.perf_counter() - start
+        downloaded += len(data)
+
+        start = time.perf_counter()
+        text = pdf_2_ics.document_to_text(url, data)
+        timings["extract"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        menu_events = pdf_2_ics.text_to_events(text, event_title, language, language,
+                                               pdf_2_ics.document_date_hint(link))
+        timings["events"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        ics_string = pdf_2_ics.serialize_events(menu_events)
+        timings["serialize"] += time.perf_counter() - start
+
+        documents += 1
+        events += len(menu_events)
+        output = normalize_ics(ics_string)
+        golden_path = os.path.join(GOLDEN, entry["file"] + ".ics")
+        if update_golden:
+            with open(golden_path, "w", encoding="utf-8") as f:
+                f.write(output)
+            continue
+        if not os.path.exists(golden_path):
+            mismatches += 1
+            print(f"golden missing: {entry['file']}")
+            continue
+        with open(golden_path, "r", encoding="utf-8") as f:
+            golden = f.read()
+        if golden != output:
+            mismatches += 1
+            print(f"golden mismatch: {entry['file']}")
+            sys.stdout.writelines(difflib.unified_diff(
+                golden.splitlines(True), output.splitlines(True), "golden", "output", n=1))
+
+    pdf_2_ics.add_emojis = original_add_emojis
+    timings["events"] -= timings["add_emojis"]
+    total = sum(timings.values())
+    print(f"{documents} documents, {events} events, {downloaded / 1e6:.1f} MB")
+    for stage, seconds in timings.items():
+        print(f"{stage:>14}: {seconds:8.3f} s  {100 * seconds / total if total else 0:5.1f}%")
+    print(f"{'total':>14}: {total:8.3f} s  {documents / total if total else 0:.1f} documents/s, "
+          f"{events / total if total else 0:.1f} events/s")
+    # ru_maxrss is in kilobytes on Linux
+    print(f"{'peak RSS':>14}: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    print(f"{mismatches} golden mismatches")
+    return mismatches
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if command == "snapshot":
+        snapshot(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    else:
+        sys.exit(1 if run(update_golden="--update-golden" in sys.argv) else 0)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+'''
+Builds synthetic menus laid out like the DPS monthly calendars, for the checks in benchmarks/.
+A PDF menu is a page with a title, a row of weekday headers, a grid of school-day cells drawn as
+rectangles, each holding its date ("May 4") and the day's menu, and a footnote below the grid.
+The cells are drawn in calendar order, so flat text extraction reads them day by day as it does on
+the real menus. The date can sit on the left, in the middle or on the right of its cell. A DOCX menu
+is the same calendar as a Word table, with the days before the 1st merged into one cell. The dishes
+only use words from lemmas.json, so parsing them never needs WordNet.
+The fixtures command writes the grid PDFs of benchmarks/pdf_layout.py to benchmarks/fixtures; the
+corpus command adds the menus of CORPUS_MENUS to the benchmark corpus of benchmarks/pipeline.py,
+marked as synthetic in its manifest, under made-up links named like the real ones. The check command
+compares the golden calendar of each of them with the menu it was drawn from, day by day: the same
+school days, each with the same dishes once the emojis are left out. It reads the golden files only,
+so a parser bug that was written into them at --update-golden time shows up here.
+Needs reportlab and python-docx (not the check command).
+Functions:
+    menu_days(year, month, language):
+        Returns the school days of a month with their dishes.
+    grid_pdf(path, title, year, month, language, align):
+        Writes a one-page calendar menu as a PDF.
+    grid_docx(path, title, year, month, language):
+        Writes a calendar menu as a DOCX table.
+    write_corpus():
+        Writes the menus of CORPUS_MENUS into the benchmark corpus and its manifest.
+    check_golden():
+        Compares the golden calendars of the menus of CORPUS_MENUS with their dates and dishes.
+Usage:
+    python benchmarks/synthetic_menus.py fixtures
+    python benchmarks/synthetic_menus.py corpus
+    python benchmarks/synthetic_menus.py check
+'''
+import calendar
+import hashlib
+import json
+import os
+import sys
+from datetime import date
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+sys.path.insert(0, ROOT)
+
+import emoji  # noqa: E402
+
+from menu_calendar import read_events  # noqa: E402
+from pdf_2_ics import MONTH_NAMES  # noqa: E402
+
+# Dishes of each language, picked in turn from the day of the month
+DISHES = {
+    "en": [
+        ["Cheese Pizza", "Garden Salad", "Fresh Apples"],
+        ["Chicken Nuggets", "Baked Beans", "Whole Grain Roll"],
+        ["Beef Burrito", "Brown Rice", "Fresh Oranges"],
+        ["Grilled Cheese", "Vegetable Soup", "Carrots"],
+        ["Hot Dog", "Corn", "Fresh Grapes"],
+        ["Chicken Sandwich", "Steamed Broccoli", "Bananas"],
+    ],
+    "es": [
+        ["Pizza de Queso", "Ensalada", "Manzana"],
+        ["Pollo con Arroz", "Pan", "Leche"],
+        ["Burrito de Pollo", "Arroz", "Naranja"],
+        ["Sandwich de Queso", "Fresa"],
+        ["Hot Dog", "Jugo"],
+    ],
+}
+WEEKDAYS = {
+    "en": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"],
+    "es": ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"],
+}
+# The footnote under the grid; it holds a STOP_WORDS entry, as on the real menus
+FOOTNOTES = {
+    "en": "Menu subject to change. Milk is offered with every meal.",
+    "es": "Menú sujeto a cambios. Se ofrece leche con cada comida.",
+}
+
+
+def menu_days(year, month, language="en"):
+    """
+    Returns the school days of a month, Monday to Friday, with their dishes.
+    Args:
+        year (int): The year.
+        month (int): The month.
+        language (str): The language of the dishes, "en" or "es".
+    Returns:
+        list: A list of (datetime.date, list of dishes) tuples, in calendar order.
+    """
+    dishes = DISHES[language]
+    return [(date(year, month, day), dishes[day % len(dishes)])
+            for day in range(1, calendar.monthrange(year, month)[1] + 1)
+            if date(year, month, day).weekday() < 5]
+
+
+def grid_pdf(path, title, year, month, language="en", align="left"):
+    """
+    Writes a one-page calendar menu as a PDF, one column per weekday and one row per week.
+    Args:
+        path (str): The PDF file to write.
+        title (str): The title printed above the grid.
+        year (int): The year of the menu.
+        month (int): The month of the menu.
+        language (str): The language of the dates and dishes, "en" or "es".
+        align (str): Where the date sits in its cell: "left", "center" or "right".
+    Returns:
+        None
+    """
+    from reportlab.lib.pagesizes import landscape, letter
+    from reportlab.pdfgen import canvas
+
+    (width, height) = landscape(letter)
+    (left, top, cell_width, cell_height) = (36, height - 110, (width - 72) / 5, 100)
+    pdf = canvas.Canvas(path, pagesize=(width, height), invariant=1)
+    pdf.setFont("Helvetica-Bold", 18)
+    pdf.drawCentredString(width / 2, height - 50, title)
+    pdf.setFont("Helvetica-Bold", 11)
+    for column, name in enumerate(WEEKDAYS[language]):
+        pdf.drawCentredString(left + (column + 0.5) * cell_width, top + 10, name)
+    days = menu_days(year, month, language)
+    first_week = days[0][0].isocalendar()[1]
+    for day, dishes in days:
+        (column, row) = (day.weekday(), day.isocalendar()[1] - first_week)
+        (x, y) = (left + column * cell_width, top - (row + 1) * cell_height)
+        pdf.rect(x, y, cell_width, cell_height)
+        label = f"{MONTH_NAMES[language][month - 1]} {day.day}"
+        pdf.setFont("Helvetica-Bold", 10)
+        if align == "right":
+            pdf.drawRightString(x + cell_width - 6, y + cell_height - 14, label)
+        elif align == "center":
+            pdf.drawCentredString(x + cell_width / 2, y + cell_height - 14, label)
+        else:
+            pdf.drawString(x + 6, y + cell_height - 14, label)
+        pdf.setFont("Helvetica", 9)
+        for line, dish in enumerate(dishes):
+            pdf.drawString(x + 6, y + cell_height - 30 - 12 * line, dish)
+    pdf.setFont("Helvetica-Oblique", 9)
+    pdf.drawString(left, top - (days[-1][0].isocalendar()[1] - first_week + 1) * cell_height - 20,
+                   FOOTNOTES[language])
+    pdf.showPage()
+    pdf.save()
+
+
+def grid_docx(path, title, year, month, language="en"):
+    """
+    Writes a calendar menu as a DOCX table: a row of weekday headers, then one row per week with each
+    school day's date and dishes as the paragraphs of its cell. The days of the first week before the
+    1st are merged into one empty cell. The title and footnote are paragraphs around the table.
+    Args:
+        path (str): The DOCX file to write.
+        title (str): The title written above the table.
+        year (int): The year of the menu.
+        month (int): The month of the menu.
+        language (str): The language of the dates and dishes, "en" or "es".
+    Returns:
+        None
+    """
+    import docx
+
+    document = docx.Document()
+    document.add_paragraph(title)
+    days = menu_days(year, month, language)
+    first_week = days[0][0].isocalendar()[1]
+    weeks = days[-1][0].isocalendar()[1] - first_week + 1
+    table = document.add_table(rows=weeks + 1, cols=5)
+    for column, name in enumerate(WEEKDAYS[language]):
+        table.cell(0, column).text = name
+    if days[0][0].weekday() > 1:
+        table.cell(1, 0).merge(table.cell(1, days[0][0].weekday() - 1))
+    for day, dishes in days:
+        cell = table.cell(day.isocalendar()[1] - first_week + 1, day.weekday())
+        cell.text = f"{MONTH_NAMES[language][month - 1]} {day.day}"
+        for dish in dishes:
+            cell.add_paragraph(dish)
+    document.add_paragraph(FOOTNOTES[language])
+    document.save(path)
+
+
+# The synthetic menus of the benchmark corpus: (link, year, month, language, layout), where layout is
+# the alignment of the dates of a PDF grid, or "docx"
+CORPUS_MENUS = [
+    ("https://synthetic.invalid/menus/1001/High-School-Lunch---April-2026.pdf", 2026, 4, "en", "left"),
+    ("https://synthetic.invalid/menus/1002/DPS-Primaria-Almuerzo-May26-Spanish.pdf", 2026, 5, "es", "right"),
+    ("https://synthetic.invalid/menus/1003/Breakfast-in-the-Classroom---May-2026.pdf", 2026, 5, "en", "center"),
+    ("https://synthetic.invalid/menus/1004/DPS_HS_Lunch_Apr25_Spanish.pdf", 2025, 4, "es", "left"),
+    ("https://synthetic.invalid/menus/1005/Whitted-Pre-K-Lunch---October.pdf", 2025, 10, "en", "right"),
+    ("https://synthetic.invalid/menus/1006/After-School-Snack-Program-Aug25-Spanish.docx", 2025, 8, "es", "docx"),
+    ("https://synthetic.invalid/menus/1007/Elementary-Lunch-Mar26.docx", 2026, 3, "en", "docx"),
+    ("https://synthetic.invalid/menus/1008/DPS-K12-Breakfast-Feb26.docx", 2026, 2, "en", "docx"),
+]
+
+
+def write_corpus():
+    """
+    Writes the menus of CORPUS_MENUS into the benchmark corpus, named as benchmarks/pipeline.py names
+    its snapshots, and adds them to its manifest, keeping the entries already there.
+    Returns:
+        None
+    """
+    manifest_path = os.path.join(CORPUS, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    os.makedirs(CORPUS, exist_ok=True)
+    for link, year, month, language, layout in CORPUS_MENUS:
+        parts = link.split("/")
+        name = f"{parts[-2]}_{parts[-1]}"
+        path = os.path.join(CORPUS, name)
+        title = f"DPS {os.path.splitext(parts[-1])[0].replace('-', ' ').replace('_', ' ')}"
+        if layout == "docx":
+            grid_docx(path, title, year, month, language)
+        else:
+            grid_pdf(path, title, year, month, language, layout)
+        with open(path, "rb") as f:
+            manifest[link] = {"file": name, "sha256": hashlib.sha256(f.read()).hexdigest(), "synthetic": True}
+        print(path)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def check_golden():
+    """
+    Compares the golden calendar of each menu of CORPUS_MENUS with the school days and dishes the menu
+    was drawn with, and prints every day that is missing, extra or has other dishes.
+    Returns:
+        int: The number of days that differ, including those of a missing golden file.
+    """
+    failures = 0
+    for link, year, month, language, _ in CORPUS_MENUS:
+        parts = link.split("/")
+        name = f"{parts[-2]}_{parts[-1]}"
+        expected = dict(menu_days(year, month, language))
+        golden_path = os.path.join(CORPUS, "golden", name + ".ics")
+        if not os.path.exists(golden_path):
+            failures += len(expected)
+            print(f"FAILED: golden missing: {name}")
+            continue
+        with open(golden_path, "r", encoding="utf-8") as f:
+            events = read_events(f.read())
+        # the dishes of each day, without the emojis add_emojis() appends to them
+        actual = {event.begin: [emoji.replace_emoji(line, "").strip()
+                                for line in event.description.split("\n") if line.strip()] for event in events}
+        for day in sorted(set(expected) | set(actual)):
+            if expected.get(day) != actual.get(day):
+                failures += 1
+                print(f"FAILED: {name} {day}: {actual.get(day)}, expected {expected.get(day)}")
+        if len(events) != len(actual):
+            failures += len(events) - len(actual)
+            print(f"FAILED: {name}: {len(events) - len(actual)} days with more than one event")
+        print(f"{name}: {len(expected)} days checked")
+    return failures
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "fixtures"
+    if command == "corpus":
+        write_corpus()
+    elif command == "check":
+        failures = check_golden()
+        print(f"{failures} failures")
+        sys.exit(1 if failures else 0)
+    else:
+        os.makedirs(FIXTURES, exist_ok=True)
+        for align in ("left", "center", "right"):
+            path = os.path.join(FIXTURES, f"grid_{align}_dates.pdf")
+            grid_pdf(path, "DPS K12 School Lunch Menu - May 2026", 2026, 5, "en", align)
+            print(path)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+This script regenerates lemmas.json, the table of precomputed WordNet lemmas pdf_2_ics.py uses
+so that most menu lines are annotated without loading WordNet.
+It lemmatizes every word already in the table plus every word in the descriptions of the given
+ICS files (by default, the ICS files in the current directory) and writes the result back.
+Usage:
+    python setup.py
+    python pdf_2_ics.py
+    python build_lemmas.py [file.ics ...]
+"""
+import glob
+import json
+import sys
+
+import emoji
+from nltk.stem import WordNetLemmatizer
+
+from menu_calendar import read_events
+from pdf_2_ics import LEMMAS_JSON, load_lemma_table
+
+if __name__ == "__main__":
+    filenames = sys.argv[1:] or glob.glob("*.ics")
+    words = set(load_lemma_table())
+    for filename in filenames:
+        with open(filename, "r", encoding="utf-8") as f:
+            events = read_events(f.read())
+        for event in events:
+            # drop the emojis add_emojis() appended, to get back the words it lemmatized
+            description = emoji.replace_emoji(event.description or "", replace="")
+            words.update(description.replace(":", "").lower().split())
+
+    wnl = WordNetLemmatizer()
+    table = {word: wnl.lemmatize(word) for word in sorted(words) if any(c.isalpha() for c in word)}
+    with open(LEMMAS_JSON, "w", encoding="utf-8") as f:
+        json.dump(table, f, indent=1, ensure_ascii=False)
+    print(f"{len(table)} lemmas written to {LEMMAS_JSON}")
@@ -3,9 +3,30 @@ This script interacts with the Google Calendar API to upload events from ICS fil
 It supports both processing individual ICS files in a directory and processing ICS files within a ZIP archive.
 Functions:
 - authenticate(): Authenticates the user with Google OAuth2 and returns the credentials.
+- get_credentials(): Returns the credentials shared by every thread, authenticating on first use.
 - get_calendar_service(): Returns the Google Calendar API service object.
+- get_thread_service(): Returns a Google Calendar API service object owned by the calling thread.
+- RateLimiter(rate, burst): A token bucket shared by all threads, to stay under the per-user API quota.
+- get_rate_limiter(): Returns the rate limiter shared by all threads.
+- is_rate_limited(exception): Checks if an API error is a rate limit error worth retrying.
+- backoff(attempt): Sleeps for an exponentially growing, jittered delay before a retry.
+- execute_request(request, cost, calendar): Executes an API request through the rate limiter, backing off on rate limit errors.
 - search_events_by_date(service, cal_id, date_str): Searches for events on a given date in a specified calendar.
+- to_utc_timestamp(date_obj, hour, minute, second): Converts a local time on a date to an API timestamp in UTC.
+- list_events_in_range(service, cal_id, first_date, last_date, calendar): Lists all events between two dates with one paginated query.
+- index_events_by_date(events): Groups events by the dates they cover.
+- list_calendar_changes(service, cal_id, sync_token, calendar): Lists every event of a calendar, or only those changed since a sync token.
+- compact_event(event): Keeps the fields of an event that diff_events() needs.
+- execute_batch(service, requests, calendar): Sends API requests through the HTTP batch endpoint, BATCH_SIZE at a time.
+- content_hash(body): Returns the hash of the content of an event.
+- event_body(event): Converts a parsed ICS event into an API event body, with its content hash.
+- existing_hash(event): Returns the stored or computed content hash of an event from the calendar.
+- diff_events(events, existing_events): Lists the inserts, patches and deletes that make a calendar match an ICS file.
+- SyncIndex(path, verify_days): The known events of each calendar, kept between runs and refreshed with sync tokens.
+- get_sync_index(): Returns the sync index shared by all threads, or None if it is disabled.
+- get_synced_manifest(): Returns the digests of the ICS files as last synced, or None if it is disabled.
 - load_resources(): Loads the necessary resources such as calendar IDs and initializes the Google Calendar service.
+- sync_calendars(menu_ids, service, files, max_workers): Uploads the events of several ICS files, one calendar per worker.
 - process_zip(menu_ids, service, zip_filepath): Processes ICS files within a ZIP archive and uploads events to Google Calendar.
 - process_dir(menu_ids, service): Processes ICS files in the current directory and uploads events to Google Calendar.
 Usage:
@@ -13,14 +34,22 @@ Usage:
 - Run the script. It will either process a ZIP file named 'calendars.zip' or process individual ICS files in the current directory.
 '''
 import datetime
+import hashlib
 from datetime import date, timedelta, timezone
 import zipfile
 import os
 import os.path
 import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 
-from ics import Calendar
+import metrics
+from atomic_file import atomic_write_json
+
+from menu_calendar import DigestManifest, ics_digest, read_events
 
 import google.auth
 from google.auth.transport.requests import Request
@@ -32,6 +61,38 @@ from googleapiclient.errors import HttpError
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/calendar.events"]
 
+# The Calendar API accepts at most 50 requests in one HTTP batch
+BATCH_SIZE = 50
+
+# Number of calendars synced at the same time
+MAX_WORKERS = int(os.environ.get("GCAL_MAX_WORKERS", "4"))
+# API requests per second shared by all workers, below Google's per-user quota
+MAX_QPS = float(os.environ.get("GCAL_MAX_QPS", "5"))
+# Attempts at a request that keeps hitting rate limits before giving up
+MAX_RETRIES = 6
+# Run report written at the end of a run, as JSON and, if a path is set, as a Prometheus textfile
+REPORT_JSON = os.environ.get("GCAL_REPORT_JSON", "gcal_report.json")
+REPORT_PROMETHEUS = os.environ.get("GCAL_REPORT_PROMETHEUS", "")
+
+# Key of the private extended property holding the hash of a menu event's content
+CONTENT_HASH_KEY = "dpsMenuHash"
+# Digest of each ICS file as last synced, so unchanged files are skipped; empty to always sync
+SYNCED_MANIFEST_JSON = os.environ.get("GCAL_SYNCED_MANIFEST", os.path.join(".cache", "gcal_synced.json"))
+# Known events of each calendar, kept between runs; empty to list the events of every file from the API
+SYNC_INDEX_JSON = os.environ.get("GCAL_SYNC_INDEX", os.path.join(".cache", "gcal_sync_index.json"))
+# Days after which a calendar's index is rebuilt from a full listing instead of incremental changes
+SYNC_VERIFY_DAYS = float(os.environ.get("GCAL_SYNC_VERIFY_DAYS", "30"))
+
+_credentials = None
+_credentials_lock = threading.Lock()
+_thread_local = threading.local()
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+_sync_index = None
+_sync_index_lock = threading.Lock()
+_synced_manifest = None
+_synced_manifest_lock = threading.Lock()
+
 
 def authenticate():
     """
@@ -102,11 +163,147 @@ def get_calendar_service():
         googleapiclient.discovery.Resource: A Google Calendar service object
         that can be used to interact with the Google Calendar API.
     """
-    creds = authenticate()
+    creds = get_credentials()
     service = build('calendar', 'v3', credentials=creds)
     return service
 
 
+def get_credentials():
+    """
+    Returns the credentials shared by every thread, authenticating only on the first call.
+
+    Returns:
+        google.oauth2.credentials.Credentials: The authenticated user's credentials.
+    """
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            with metrics.span("authenticate"):
+                _credentials = authenticate()
+        return _credentials
+
+
+def get_thread_service():
+    """
+    Returns a Google Calendar service object for the calling thread.
+
+    Service objects are not thread-safe, so each worker thread builds its own, with the shared credentials.
+
+    Returns:
+        googleapiclient.discovery.Resource: A Google Calendar service object.
+    """
+    if not hasattr(_thread_local, 'service'):
+        _thread_local.service = get_calendar_service()
+    return _thread_local.service
+
+
+class RateLimiter:
+    """
+    A token bucket shared by all threads.
+
+    Tokens are added at rate per second, up to burst. acquire() blocks until enough tokens
+    are available, so the API requests of every worker together stay under rate per second.
+    """
+
+    def __init__(self, rate=MAX_QPS, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Takes tokens from the bucket, waiting for them if needed.
+
+        Args:
+            tokens (int): The number of API requests about to be sent.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                # a batch may cost more than the bucket holds; let it through once the bucket is full
+                if self._tokens >= min(tokens, self.burst):
+                    self._tokens -= tokens
+                    return
+                wait = (min(tokens, self.burst) - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def get_rate_limiter():
+    """
+    Returns the rate limiter shared by all threads, created on first use.
+
+    Returns:
+        RateLimiter: The shared rate limiter.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+def is_rate_limited(exception):
+    """
+    Checks if an API error means the request was rejected for going over the quota.
+
+    Args:
+        exception (Exception): The error raised by, or passed back for, a request.
+
+    Returns:
+        bool: True for 429 responses and 403 rateLimitExceeded/userRateLimitExceeded responses.
+    """
+    if not isinstance(exception, HttpError):
+        return False
+    if exception.resp.status == 429:
+        return True
+    content = exception.content.decode('utf-8', 'replace') if isinstance(exception.content, bytes) else str(exception.content)
+    return exception.resp.status == 403 and 'ratelimitexceeded' in content.lower()
+
+
+def backoff(attempt):
+    """
+    Sleeps before retrying a rate limited request: 1, 2, 4... seconds, plus up to a second of jitter.
+
+    Args:
+        attempt (int): The number of attempts made so far, starting at 0.
+    """
+    time.sleep(2 ** attempt + random.random())
+
+
+def execute_request(request, cost=1, calendar=None):
+    """
+    Executes an API request once the rate limiter allows it, retrying with exponential backoff on rate limit errors.
+
+    Args:
+        request: The unexecuted request, e.g. service.events().list(...).
+        cost (int): The number of API requests it counts as against the quota.
+        calendar (str): The ICS filename the request is made for, to label its API call and retry counts, or None.
+
+    Returns:
+        The response of the request.
+
+    Raises:
+        googleapiclient.errors.HttpError: If the request fails for another reason, or is still rate limited after MAX_RETRIES attempts.
+    """
+    labels = {'calendar': calendar} if calendar else {}
+    for attempt in range(MAX_RETRIES):
+        with metrics.span("rate_limit_wait"):
+            get_rate_limiter().acquire(cost)
+        metrics.count("api_calls", cost, **labels)
+        try:
+            with metrics.span("api_request"):
+                return request.execute()
+        except HttpError as e:
+            if not is_rate_limited(e) or attempt == MAX_RETRIES - 1:
+                raise
+            metrics.count("api_retries", **labels)
+            backoff(attempt)
+
+
 def search_events_by_date(service, cal_id, date_str):
     """
     Searches for events on a given date.
@@ -119,20 +316,407 @@ def search_events_by_date(service, cal_id, date_str):
     Returns:
         A list of events for the given date, or an empty list if no events are found.
     """
-    tz_UTC = pytz.timezone('UTC')
     date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-    start_of_day = (datetime.datetime(date_obj.year, date_obj.month, date_obj.day, 00, 00, 00)
-        ).astimezone(tz_UTC).isoformat().removesuffix("+00:00")+'Z'
-    end_of_day = (datetime.datetime(date_obj.year, date_obj.month, date_obj.day, 23, 59, 59)
-        ).astimezone(tz_UTC).isoformat().removesuffix("+00:00")+'Z'
+    start_of_day = to_utc_timestamp(date_obj, 00, 00, 00)
+    end_of_day = to_utc_timestamp(date_obj, 23, 59, 59)
 
-    events_result = service.events().list(calendarId=cal_id, timeMin=start_of_day,
-                                            timeMax=end_of_day, singleEvents=True,
-                                            orderBy='startTime').execute()
+    events_result = execute_request(service.events().list(calendarId=cal_id, timeMin=start_of_day,
+                                                          timeMax=end_of_day, singleEvents=True,
+                                                          orderBy='startTime'))
     events = events_result.get('items', [])
     return events
 
 
+def to_utc_timestamp(date_obj, hour, minute, second):
+    """
+    Converts a local time on the given date to the UTC timestamp format used by the API.
+
+    Args:
+        date_obj (datetime.date): The date.
+        hour, minute, second (int): The local time on that date.
+
+    Returns:
+        str: The timestamp, in 'YYYY-MM-DDTHH:MM:SSZ' format.
+    """
+    tz_UTC = pytz.timezone('UTC')
+    return (datetime.datetime(date_obj.year, date_obj.month, date_obj.day, hour, minute, second)
+        ).astimezone(tz_UTC).isoformat().removesuffix("+00:00")+'Z'
+
+
+def list_events_in_range(service, cal_id, first_date, last_date, calendar=None):
+    """
+    Lists every event between two dates, following the result pages.
+
+    Args:
+        service: The Google Calendar API service object.
+        cal_id: The Google Calendar ID string
+        first_date (datetime.date): The first date of the range.
+        last_date (datetime.date): The last date of the range, included.
+        calendar (str): The ICS filename the request is made for, to label its API call counts, or None.
+
+    Returns:
+        A list of the events in the range, or an empty list if there are none.
+    """
+    events = []
+    page_token = None
+    while True:
+        events_result = execute_request(service.events().list(calendarId=cal_id,
+                                                              timeMin=to_utc_timestamp(first_date, 00, 00, 00),
+                                                              timeMax=to_utc_timestamp(last_date, 23, 59, 59),
+                                                              singleEvents=True, maxResults=2500,
+                                                              pageToken=page_token), calendar=calendar)
+        events.extend(events_result.get('items', []))
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            break
+    return events
+
+
+def list_calendar_changes(service, cal_id, sync_token=None, calendar=None):
+    """
+    Lists every event of a calendar, or with a sync token only the events changed since it was
+    issued, deleted ones included with status 'cancelled'. Follows the result pages.
+
+    Args:
+        service: The Google Calendar API service object.
+        cal_id: The Google Calendar ID string
+        sync_token (str): The nextSyncToken of an earlier listing, or None for a full listing.
+        calendar (str): The ICS filename the request is made for, to label its API call counts, or None.
+
+    Returns:
+        tuple: The list of events and the nextSyncToken for the next incremental listing.
+
+    Raises:
+        googleapiclient.errors.HttpError: With status 410 if the sync token has expired.
+    """
+    events = []
+    page_token = None
+    while True:
+        events_result = execute_request(service.events().list(calendarId=cal_id, syncToken=sync_token,
+                                                              singleEvents=True, maxResults=2500,
+                                                              pageToken=page_token), calendar=calendar)
+        events.extend(events_result.get('items', []))
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return events, events_result.get('nextSyncToken')
+
+
+def compact_event(event):
+    """
+    Keeps the fields of an event that diff_events() looks at, to store it in the sync index.
+    The description is only kept for events without a stored content hash, which need it to compute one.
+
+    Args:
+        event (dict): An event returned by the Google Calendar API.
+
+    Returns:
+        dict: The ID, summary, start, end and content hash of the event.
+    """
+    compact = {key: event[key] for key in ('id', 'summary', 'start', 'end', 'extendedProperties') if key in event}
+    if CONTENT_HASH_KEY not in event.get('extendedProperties', {}).get('private', {}):
+        compact['description'] = event.get('description')
+    return compact
+
+
+def index_events_by_date(events):
+    """
+    Groups events by the dates they take place on.
+    All-day events are listed under every day they cover, timed events under the day they start.
+
+    Args:
+        events (list): Events as returned by the Google Calendar API.
+
+    Returns:
+        dict: A dictionary mapping 'YYYY-MM-DD' strings to the list of events on that date.
+    """
+    index = {}
+    for event in events:
+        start = event.get('start', {})
+        if 'date' in start:
+            day = date.fromisoformat(start['date'])
+            end = date.fromisoformat(event.get('end', {}).get('date', start['date']))
+            while True:
+                index.setdefault(day.isoformat(), []).append(event)
+                day += timedelta(days=1)
+                if day >= end:
+                    break
+        elif 'dateTime' in start:
+            index.setdefault(start['dateTime'][:10], []).append(event)
+    return index
+
+
+def execute_batch(service, requests, calendar=None):
+    """
+    Executes API requests through the HTTP batch endpoint, up to BATCH_SIZE per round trip.
+    Each request counts against the rate limiter, and requests rejected for going over the quota
+    are sent again in a later batch, with exponential backoff.
+
+    Args:
+        service (googleapiclient.discovery.Resource): The Google Calendar API service object.
+        requests (list): The unexecuted requests, e.g. service.events().insert(...).
+        calendar (str): The ICS filename the request is made for, to label its API call counts, or None.
+
+    Returns:
+        list: One (response, exception) tuple per request, in the order of the requests.
+        exception is None when the request succeeded.
+    """
+    results = [None] * len(requests)
+    labels = {'calendar': calendar} if calendar else {}
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+
+    pending = list(range(len(requests)))
+    for attempt in range(MAX_RETRIES):
+        for start in range(0, len(pending), BATCH_SIZE):
+            chunk = pending[start:start + BATCH_SIZE]
+            batch = service.new_batch_http_request(callback=callback)
+            for index in chunk:
+                batch.add(requests[index], request_id=str(index))
+            execute_request(batch, cost=len(chunk), calendar=calendar)
+        pending = [index for index in pending if is_rate_limited(results[index][1])]
+        if not pending or attempt == MAX_RETRIES - 1:
+            break
+        metrics.count("api_retries", len(pending), **labels)
+        backoff(attempt)
+    return results
+
+
+def content_hash(body):
+    """
+    Returns a hash of the summary, description and dates of an event.
+
+    Args:
+        body (dict): An event, as sent to or returned by the Google Calendar API.
+
+    Returns:
+        str: The SHA-256 hex digest of the event content.
+    """
+    content = [body.get('summary') or '', body.get('description') or '',
+               body.get('start', {}).get('date'), body.get('end', {}).get('date')]
+    return hashlib.sha256(json.dumps(content).encode('utf-8')).hexdigest()
+
+
+def event_body(event):
+    """
+    Converts an event parsed from an ICS file into a Google Calendar API event body.
+
+    Args:
+        event (menu_calendar.MenuEvent): The parsed event.
+
+    Returns:
+        dict: The event body, with its content hash in a private extended property.
+    """
+    body = {
+        'summary': event.name,
+        'description': event.description,
+        'start': {'date': event.begin.strftime("%Y-%m-%d")},
+        'end': {'date': event.end.strftime("%Y-%m-%d")}
+    }
+    body['extendedProperties'] = {'private': {CONTENT_HASH_KEY: content_hash(body)}}
+    return body
+
+
+def existing_hash(event):
+    """
+    Returns the content hash of an event from the calendar.
+
+    Args:
+        event (dict): An event returned by the Google Calendar API.
+
+    Returns:
+        str: The stored content hash, or the hash of its current content if none was stored.
+    """
+    stored = event.get('extendedProperties', {}).get('private', {}).get(CONTENT_HASH_KEY)
+    return stored if stored is not None else content_hash(event)
+
+
+def diff_events(events, existing_events):
+    """
+    Compares the events of an ICS file with the events already in the calendar.
+
+    Only existing events this script manages are considered: events with a content hash, and
+    events created before hashes were stored, recognized by having the same summary as the file's
+    events. Other events in the calendar are left alone. On each date, managed events are matched
+    with the file's events; unchanged ones are kept, changed ones are patched, missing ones are
+    inserted, and managed events left over on dates inside the span of the file are deleted.
+
+    Args:
+        events (list): Event bodies built from the ICS file with event_body().
+        existing_events (list): The calendar's events over the span of the file, from list_events_in_range().
+
+    Returns:
+        tuple: (inserts, patches, deletes), where inserts is a list of event bodies, patches a list
+        of (event ID, event body) tuples and deletes a list of event IDs.
+    """
+    if not events:
+        return [], [], []
+    summaries = set(body['summary'] for body in events)
+    managed = [event for event in existing_events
+               if CONTENT_HASH_KEY in event.get('extendedProperties', {}).get('private', {})
+               or event.get('summary') in summaries]
+    existing_by_date = index_events_by_date(managed)
+
+    inserts, patches = [], []
+    claimed = set()
+    for body in sorted(events, key=lambda body: (body['start']['date'], body['description'] or '')):
+        candidates = [event for event in existing_by_date.get(body['start']['date'], [])
+                      if event['id'] not in claimed]
+        new_hash = body['extendedProperties']['private'][CONTENT_HASH_KEY]
+        # prefer an event that is already up to date, so nothing needs to change
+        match = next((event for event in candidates if existing_hash(event) == new_hash),
+                     candidates[0] if candidates else None)
+        if match is None:
+            inserts.append(body)
+            continue
+        claimed.add(match['id'])
+        if existing_hash(match) != new_hash:
+            patches.append((match['id'], body))
+        elif CONTENT_HASH_KEY not in match.get('extendedProperties', {}).get('private', {}):
+            # unchanged, but created before hashes were stored; record the hash once
+            patches.append((match['id'], {'extendedProperties': body['extendedProperties']}))
+
+    first_date = min(body['start']['date'] for body in events)
+    last_date = max(body['start']['date'] for body in events)
+    deletes = []
+    for event in managed:
+        start = event.get('start', {})
+        start_date = start.get('date') or start.get('dateTime', '')[:10]
+        if event['id'] not in claimed and first_date <= start_date <= last_date:
+            claimed.add(event['id'])
+            deletes.append(event['id'])
+    return inserts, patches, deletes
+
+
+class SyncIndex:
+    """
+    The known events of each calendar, kept in a JSON file between runs.
+
+    For each calendar ID, the index holds its events in compact_event() form, keyed by event ID,
+    with the date, remote ID and content hash diff_events() compares with, and the sync token of the
+    last listing. Instead of listing the events of a file's span on every run, a calendar is brought
+    up to date with one incremental listing of the events changed since (usually an empty page), and
+    the index is updated with the results of our own inserts, patches and deletes. Every verify_days,
+    or when the sync token has expired, the calendar is listed in full again to verify the index.
+    Each calendar must only be synced by one thread at a time, as sync_calendars() does.
+    """
+
+    def __init__(self, path=SYNC_INDEX_JSON, verify_days=SYNC_VERIFY_DAYS):
+        self.path = path
+        self.verify_days = verify_days
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self._calendars = json.load(f)
+        else:
+            self._calendars = {}
+
+    def _save(self):
+        atomic_write_json(self.path, self._calendars)
+
+    def existing_events(self, service, cal_id, first_date, last_date, calendar=None):
+        """
+        Returns the events of a calendar between two dates, refreshing the index first.
+
+        Args:
+            service: The Google Calendar API service object.
+            cal_id: The Google Calendar ID string
+            first_date (datetime.date): The first date of the range.
+            last_date (datetime.date): The last date of the range, included.
+            calendar (str): The ICS filename the events are listed for, to label the API call counts, or None.
+
+        Returns:
+            list: The events in the range, in compact_event() form.
+        """
+        with self._lock:
+            entry = self._calendars.get(cal_id)
+        now = time.time()
+        if entry is not None and now - entry['verified'] < self.verify_days * 86400:
+            try:
+                changes, sync_token = list_calendar_changes(service, cal_id, entry['sync_token'], calendar)
+                metrics.count("sync_index_incremental")
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+                entry = None
+        else:
+            entry = None
+        if entry is None:
+            # full listing: start over, so events deleted behind our back are forgotten
+            changes, sync_token = list_calendar_changes(service, cal_id, calendar=calendar)
+            entry = {'verified': now, 'events': {}}
+            metrics.count("sync_index_full")
+        self.apply(cal_id, changes, entry=entry, sync_token=sync_token)
+
+        first, last = first_date.isoformat(), last_date.isoformat()
+        events = []
+        for event in entry['events'].values():
+            start = event.get('start', {})
+            start_date = start.get('date') or start.get('dateTime', '')[:10]
+            end_date = event.get('end', {}).get('date') or start_date
+            # all-day events end the day after their last day
+            if start_date <= last and (end_date > first or start_date >= first):
+                events.append(event)
+        return events
+
+    def apply(self, cal_id, changes, deleted=(), entry=None, sync_token=None):
+        """
+        Records changed events of a calendar and saves the index.
+
+        Args:
+            cal_id: The Google Calendar ID string
+            changes (list): Events returned by the API; cancelled ones are removed from the index.
+            deleted (iterable): IDs of events deleted by this script.
+            entry (dict): The calendar's new index entry, after a full listing.
+            sync_token (str): The sync token to store, after a listing.
+        """
+        with self._lock:
+            if entry is not None:
+                self._calendars[cal_id] = entry
+            entry = self._calendars.get(cal_id)
+            if entry is None:
+                return
+            for event in changes:
+                if event.get('status') == 'cancelled':
+                    entry['events'].pop(event['id'], None)
+                else:
+                    entry['events'][event['id']] = compact_event(event)
+            for event_id in deleted:
+                entry['events'].pop(event_id, None)
+            if sync_token is not None:
+                entry['sync_token'] = sync_token
+            self._save()
+
+
+def get_sync_index():
+    """
+    Returns the sync index shared by all threads, or None if GCAL_SYNC_INDEX is empty.
+
+    Returns:
+        SyncIndex: The shared index, loaded on first use.
+    """
+    global _sync_index
+    with _sync_index_lock:
+        if _sync_index is None and SYNC_INDEX_JSON:
+            _sync_index = SyncIndex(SYNC_INDEX_JSON)
+        return _sync_index
+
+
+def get_synced_manifest():
+    """
+    Returns the digests of the ICS files as last synced, shared by all threads, or None if
+    GCAL_SYNCED_MANIFEST is empty.
+
+    Returns:
+        menu_calendar.DigestManifest: The shared manifest, loaded on first use.
+    """
+    global _synced_manifest
+    with _synced_manifest_lock:
+        if _synced_manifest is None and SYNCED_MANIFEST_JSON:
+            _synced_manifest = DigestManifest(SYNCED_MANIFEST_JSON)
+        return _synced_manifest
+
+
 def load_resources():
     """
     Load resources required for the application.
@@ -182,7 +766,13 @@ def load_resources():
 
 def process_content(menu_ids, service, filename, content):
     """
-    Processes the content of a calendar file and adds events to a Google Calendar.
+    Processes the content of a calendar file and brings a Google Calendar in line with it.
+
+    Events are compared by date and content hash with diff_events(), and only the resulting
+    inserts, patches and deletes are sent, batched. A corrected menu thus updates the days
+    that changed instead of being ignored. A file whose digest matches the one recorded at its
+    last complete sync is skipped without any API call. The calendar's existing events come from the
+    sync index when it is enabled, and from list_events_in_range() otherwise.
 
     Args:
       menu_ids (dict): A dictionary mapping filenames to Google Calendar IDs.
@@ -193,22 +783,95 @@ def process_content(menu_ids, service, filename, content):
     Returns:
       None
     """
-    calendar = Calendar(content)
-    for event in calendar.events:
-        date_to_search = event.begin.strftime("%Y-%m-%d")
-        # check for existing events on the date we are considering
-        events_on_date = search_events_by_date(service, menu_ids[filename], date_to_search)
-        new_event = {
-            'summary': event.name,
-            'description': event.description,
-            'start': {'date': event.begin.strftime("%Y-%m-%d")},
-            'end': {'date': event.end.strftime("%Y-%m-%d")}
-        }
-        if not events_on_date:
-            # print(new_event)
-            # Uncomment these when we are ready to push to the cals
-            new_event = service.events().insert(calendarId=menu_ids[filename], body=new_event).execute()
-            print('Event created: %s' % (new_event.get('htmlLink')))
+    digest = ics_digest(content)
+    synced = get_synced_manifest()
+    if synced is not None and synced.get(filename) == digest:
+        metrics.count("calendars_unchanged", calendar=filename)
+        print('Calendar unchanged')
+        return
+    events = read_events(content)
+    if not events:
+        return
+    cal_id = menu_ids[filename]
+    # fetch the existing events of the whole span of the file at once
+    first_date = min(event.begin for event in events)
+    last_date = max(event.begin for event in events)
+    index = get_sync_index()
+    if index is not None:
+        existing_events = index.existing_events(service, cal_id, first_date, last_date, filename)
+    else:
+        existing_events = list_events_in_range(service, cal_id, first_date, last_date, filename)
+    inserts, patches, deletes = diff_events([event_body(event) for event in events], existing_events)
+    metrics.count("events_parsed", len(events), calendar=filename)
+    metrics.count("events_existing", len(existing_events), calendar=filename)
+
+    requests = ([service.events().insert(calendarId=cal_id, body=body) for body in inserts]
+                + [service.events().patch(calendarId=cal_id, eventId=event_id, body=body)
+                   for event_id, body in patches]
+                + [service.events().delete(calendarId=cal_id, eventId=event_id) for event_id in deletes])
+    actions = ['created'] * len(inserts) + ['updated'] * len(patches) + ['deleted'] * len(deletes)
+    failed = False
+    changed, deleted = [], []
+    event_ids = [None] * (len(inserts) + len(patches)) + deletes
+    for action, event_id, (response, exception) in zip(actions, event_ids, execute_batch(service, requests, filename)):
+        if exception is not None:
+            failed = True
+            metrics.count("events_failed", calendar=filename)
+            print('Event not %s: %s' % (action, exception))
+            continue
+        metrics.count("events_" + action, calendar=filename)
+        if action == 'deleted':
+            deleted.append(event_id)
+            print('Event deleted')
+        else:
+            changed.append(response)
+            print('Event %s: %s' % (action, response.get('htmlLink')))
+    if index is not None:
+        index.apply(cal_id, changed, deleted)
+    # only a complete sync lets the next run skip this file
+    if synced is not None and not failed:
+        synced.record(filename, digest)
+
+
+def sync_calendars(menu_ids, service, files, max_workers=MAX_WORKERS):
+    """
+    Uploads the events of several ICS files, syncing different calendars in parallel.
+
+    Files are grouped by calendar. Each calendar is synced by a single worker, in the order its
+    files were given, while up to max_workers calendars are synced at the same time. All workers
+    share the rate limiter, so together they stay under the API quota.
+
+    Args:
+        menu_ids (dict): A dictionary mapping filenames to Google Calendar IDs.
+        service (googleapiclient.discovery.Resource): The service used when max_workers is 1.
+        files (list): (filename, content) tuples of the ICS files to upload.
+        max_workers (int): The number of calendars synced at the same time. Set GCAL_MAX_WORKERS to change the default.
+
+    Returns:
+        None
+    """
+    by_calendar = {}
+    for filename, content in files:
+        by_calendar.setdefault(menu_ids[filename], []).append((filename, content))
+
+    if max_workers <= 1 or len(by_calendar) <= 1:
+        for filename, content in files:
+            print(filename)
+            with metrics.span("sync_file"):
+                process_content(menu_ids, service, filename, content)
+        return
+
+    def sync_calendar(calendar_files):
+        thread_service = get_thread_service()
+        for filename, content in calendar_files:
+            print(filename)
+            with metrics.span("sync_file"):
+                process_content(menu_ids, thread_service, filename, content)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(sync_calendar, calendar_files) for calendar_files in by_calendar.values()]
+        for future in futures:
+            future.result()
 
 
 def process_zip(menu_ids, service, zip_filepath):
@@ -224,14 +887,15 @@ def process_zip(menu_ids, service, zip_filepath):
     """
     # For each file in the ZIP, iterate through the events and add them to the
     # calendar with the ID that matches from the menu_id.json lookup file
+    files = []
     with zipfile.ZipFile(zip_filepath, 'r') as zip_ref:
         for file_info in zip_ref.infolist():
             filename = file_info.filename
             if filename in menu_ids and menu_ids[filename] != '':
-                print(filename)
                 with zip_ref.open(file_info) as file:
                     content = file.read().decode('utf-8') # Decode assuming UTF-8
-                    process_content(menu_ids, service, filename, content)
+                    files.append((filename, content))
+    sync_calendars(menu_ids, service, files)
 
 
 def process_dir(menu_ids, service):
@@ -247,12 +911,12 @@ def process_dir(menu_ids, service):
         None
     """
     dirlist = list(filter(lambda x: x.endswith('.ics'), os.listdir()))
+    files = []
     for filename in dirlist:
         if filename in menu_ids and menu_ids[filename] != '':
-            print(filename)
             with open(filename, 'r', encoding='utf-8') as file:
-                content = file.read()
-                process_content(menu_ids, service, filename, content)
+                files.append((filename, file.read()))
+    sync_calendars(menu_ids, service, files)
 
 
 if __name__ == "__main__":
@@ -262,3 +926,4 @@ if __name__ == "__main__":
         process_zip(menu_ids, service, zip_filepath)
     else:
         process_dir(menu_ids, service)
+    metrics.write_report(REPORT_JSON, REPORT_PROMETHEUS)
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+'''
+This module holds the menu events shared by pdf_2_ics.py and gcal.py, and reads and writes them as
+iCalendar (RFC 5545) text directly, without the object model of the ics library.
+Menu calendars only ever hold all-day events with a summary and a description, so the writer
+streams those lines straight out, and the reader only understands the same small subset; it reads
+our own output, including the files written with the ics library before.
+Given the name of its calendar, the writer is deterministic: events are sorted, UIDs are derived
+from the calendar, date and content, and DTSTAMP is BUILD_DTSTAMP, so the same menu always gives the same
+bytes and its digest tells whether a calendar changed.
+Classes:
+    MenuEvent(name, begin, description):
+        One all-day menu event.
+    DigestManifest(path):
+        The SHA-256 of each calendar file, kept between runs.
+    CalendarArchive(directory, months):
+        Every event of each calendar, in month segments, with a rolling one-year ICS file per calendar.
+Functions:
+    escape_text(value):
+        Escapes a TEXT property value.
+    unescape_text(value):
+        Reverses escape_text().
+    fold_line(line):
+        Folds a content line at MAX_LINE_OCTETS octets.
+    event_uid(calendar, event):
+        Returns the stable UID of an event of a calendar.
+    iter_ics_lines(events, dtstamp, calendar):
+        Yields the lines of a calendar holding the events.
+    serialize_events(events, dtstamp, calendar):
+        Returns the calendar holding the events as a string.
+    ics_digest(ics_string):
+        Returns the SHA-256 of a serialized calendar.
+    parse_date_value(value):
+        Returns the date of a DATE or DATE-TIME value.
+    read_events(ics_string):
+        Returns the events of a calendar written by serialize_events() or by the ics library.
+'''
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from atomic_file import atomic_write_json, atomic_write_text
+
+PRODID = "-//DPS Menu Scraper//pdf_2_ics//EN"
+# Domain part of the UIDs derived by event_uid()
+UID_DOMAIN = "dps-menus"
+# Lines longer than this many octets are folded, as RFC 5545 asks
+MAX_LINE_OCTETS = 75
+# DTSTAMP of every event of a deterministic calendar: a fixed build time rather than the time of the
+# run, which would change every file on every run. Changing it rewrites every calendar file once.
+BUILD_DTSTAMP = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class MenuEvent:
+    """
+    One all-day menu event: the menu of a single day.
+
+    begin is the day of the menu, a datetime.date; end is the next day, as all-day events end
+    (exclusively) on the day after they start.
+    """
+
+    __slots__ = ("name", "begin", "description")
+
+    def __init__(self, name, begin, description=""):
+        self.name = name
+        self.begin = begin
+        self.description = description
+
+    @property
+    def end(self):
+        return self.begin + timedelta(days=1)
+
+    def __eq__(self, other):
+        return (isinstance(other, MenuEvent) and self.name == other.name and self.begin == other.begin
+                and self.description == other.description)
+
+    def __hash__(self):
+        return hash((self.name, self.begin, self.description))
+
+    def __repr__(self):
+        return f"MenuEvent({self.name!r}, {self.begin!r}, {self.description!r})"
+
+    def sort_key(self):
+        return (self.begin, self.name, self.description)
+
+
+class DigestManifest:
+    """
+    The SHA-256 of each calendar file, kept in a JSON file between runs.
+
+    pdf_2_ics.py records the digest of every ICS file it writes, and publishes the manifest with
+    the files; gcal.py keeps its own manifest of the digests it last synced, and skips the files
+    that have not changed since. It is safe to use from several threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self._files = json.load(f)
+        else:
+            self._files = {}
+
+    def get(self, filename):
+        """
+        Returns the recorded digest of a file, or None if it has none.
+        """
+        with self._lock:
+            entry = self._files.get(filename)
+        return entry["sha256"] if entry else None
+
+    def record(self, filename, digest):
+        """
+        Records the digest of a file and saves the manifest, if the digest changed.
+        Args:
+            filename (str): The name of the ICS file.
+            digest (str): Its digest, from ics_digest().
+        Returns:
+            bool: True if the digest changed, False if the file is unchanged.
+        """
+        with self._lock:
+            entry = self._files.get(filename)
+            if entry and entry["sha256"] == digest:
+                return False
+            self._files[filename] = {"sha256": digest, "updated": datetime.now(timezone.utc).isoformat()}
+            atomic_write_json(self.path, self._files, indent=1, sort_keys=True)
+            return True
+
+
+class CalendarArchive:
+    """
+    Every event of each calendar, kept as one ICS file per calendar and month.
+
+    merge() files newly parsed events under their dates, replacing the events the archive had on
+    those dates, and rewrites only the month segments whose content changed, e.g.
+    docs/calendars/english_k12_lunch/2026-05.ics. The rolling file of a calendar,
+    docs/calendars/english_k12_lunch.ics, holds the segments of the last months (the current one
+    included) and every later one, so it can be subscribed to directly. refresh() rebuilds it after
+    every merge, and refresh_all() once per run for every calendar, so months that aged out of the
+    window leave it even when nothing new was merged.
+    Everything is written with serialize_events() in its deterministic form, so unchanged files
+    keep the same bytes. It is safe to use from several threads.
+    """
+
+    def __init__(self, directory, months=12):
+        self.directory = directory
+        self.months = months
+        self._lock = threading.Lock()
+
+    def segment_path(self, calendar, month):
+        """
+        Returns the path of a month segment, e.g. <directory>/english_k12_lunch/2026-05.ics.
+        Args:
+            calendar (str): The ICS filename of the calendar.
+            month (str): The month, as YYYY-MM.
+        """
+        return os.path.join(self.directory, os.path.splitext(calendar)[0], month + ".ics")
+
+    def rolling_path(self, calendar):
+        """
+        Returns the path of the rolling file of a calendar, e.g. <directory>/english_k12_lunch.ics.
+        """
+        return os.path.join(self.directory, calendar)
+
+    def read_month(self, calendar, month):
+        """
+        Returns the events of a month segment, or an empty list if there is none.
+        """
+        path = self.segment_path(calendar, month)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            return read_events(f.read())
+
+    def _write(self, path, ics_string):
+        # leave unchanged files alone, so their modification time means something to HTTP caches
+        if os.path.exists(path):
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                if f.read() == ics_string:
+                    return False
+        atomic_write_text(path, ics_string, newline="")
+        return True
+
+    def merge(self, calendar, events, today=None):
+        """
+        Merges newly parsed events of a calendar into the archive.
+        Args:
+            calendar (str): The ICS filename of the calendar, e.g. english_k12_lunch.ics.
+            events (iterable): The MenuEvent objects. They replace every archived event on their dates.
+            today (datetime.date): The day the rolling file is built for. Defaults to today.
+        Returns:
+            list: The months (YYYY-MM) whose segment was rewritten.
+        """
+        by_month = {}
+        for event in events:
+            by_month.setdefault(event.begin.strftime("%Y-%m"), []).append(event)
+        written = []
+        with self._lock:
+            for month, new_events in sorted(by_month.items()):
+                new_dates = set(event.begin for event in new_events)
+                kept = [event for event in self.read_month(calendar, month) if event.begin not in new_dates]
+                if self._write(self.segment_path(calendar, month), serialize_events(kept + new_events, calendar=calendar)):
+                    written.append(month)
+        self.refresh(calendar, today)
+        return written
+
+    def refresh(self, calendar, today=None):
+        """
+        Rebuilds the rolling file of a calendar for the window ending today. It is only rewritten if
+        its content changed.
+        Args:
+            calendar (str): The ICS filename of the calendar.
+            today (datetime.date): The day the rolling file is built for. Defaults to today.
+        Returns:
+            bool: True if the rolling file was rewritten.
+        """
+        with self._lock:
+            return self._write(self.rolling_path(calendar), serialize_events(self.iter_rolling(calendar, today),
+                                                                             calendar=calendar))
+
+    def refresh_all(self, today=None):
+        """
+        Rebuilds the rolling file of every calendar in the archive, see refresh().
+        Args:
+            today (datetime.date): The day the rolling files are built for. Defaults to today.
+        Returns:
+            list: The ICS filenames of the calendars whose rolling file was rewritten.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        calendars = sorted(name + ".ics" for name in os.listdir(self.directory)
+                           if os.path.isdir(os.path.join(self.directory, name)))
+        return [calendar for calendar in calendars if self.refresh(calendar, today)]
+
+    def iter_rolling(self, calendar, today=None):
+        """
+        Yields the events of the rolling file of a calendar: those of the last self.months months,
+        the current one included, and of every later month.
+        """
+        today = today or date.today()
+        index = today.year * 12 + today.month - self.months
+        first_month = "%04d-%02d" % (index // 12, index % 12 + 1)
+        folder = os.path.join(self.directory, os.path.splitext(calendar)[0])
+        if not os.path.isdir(folder):
+            return
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(".ics") and name[:-4] >= first_month:
+                yield from self.read_month(calendar, name[:-4])
+
+
+def escape_text(value):
+    """
+    Escapes a TEXT property value.
+    Args:
+        value (str): The value.
+    Returns:
+        str: The value with backslashes, semicolons, commas and newlines escaped.
+    """
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def unescape_text(value):
+    """
+    Reverses escape_text().
+    Args:
+        value (str): The escaped value.
+    Returns:
+        str: The value.
+    """
+    result = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            char = next(chars, "")
+            result.append("\n" if char in ("n", "N") else char)
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+def fold_line(line):
+    """
+    Folds a content line into chunks of at most MAX_LINE_OCTETS octets, without splitting a UTF-8 character.
+    Args:
+        line (str): The unfolded line.
+    Returns:
+        str: The line, with CRLF and a space before each continuation.
+    """
+    if len(line.encode("utf-8")) <= MAX_LINE_OCTETS:
+        return line
+    chunks = []
+    chunk = []
+    size = 0
+    # continuation lines start with a space, which counts towards their length
+    limit = MAX_LINE_OCTETS
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > limit:
+            chunks.append("".join(chunk))
+            chunk = []
+            size = 0
+            limit = MAX_LINE_OCTETS - 1
+        chunk.append(char)
+        size += char_size
+    chunks.append("".join(chunk))
+    return "\r\n ".join(chunks)
+
+
+def event_uid(calendar, event):
+    """
+    Returns the UID of an event, derived from its calendar, date and content, so the same event
+    always gets the same UID and two events of a calendar never share one.
+    Args:
+        calendar (str): The name of the calendar, e.g. its ICS filename.
+        event (MenuEvent): The event.
+    Returns:
+        str: The UID, e.g. 5f0c...@dps-menus.
+    """
+    key = "\0".join((calendar, event.begin.isoformat(), event.name, event.description))
+    return f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}@{UID_DOMAIN}"
+
+
+def iter_ics_lines(events, dtstamp=None, calendar=None):
+    """
+    Yields the lines of a calendar holding the events, each ending with CRLF.
+    Without a calendar name, events are written in the order given, with random UIDs and DTSTAMP
+    set to now. With one, the output is deterministic: events are sorted by date, UIDs come from
+    event_uid() and DTSTAMP is BUILD_DTSTAMP unless dtstamp is given.
+    Args:
+        events (iterable): The MenuEvent objects. Any iterable works, including a generator.
+        dtstamp (datetime): The DTSTAMP of every event.
+        calendar (str): The name of the calendar, for deterministic output.
+    Yields:
+        str: Each content line.
+    """
+    if dtstamp is None:
+        dtstamp = datetime.now(timezone.utc) if calendar is None else BUILD_DTSTAMP
+    if calendar is not None:
+        events = sorted(events, key=MenuEvent.sort_key)
+    stamp = dtstamp.strftime('%Y%m%dT%H%M%SZ')
+    yield "BEGIN:VCALENDAR\r\n"
+    yield "VERSION:2.0\r\n"
+    yield f"PRODID:{PRODID}\r\n"
+    for event in events:
+        uid = f"{uuid.uuid4()}@uuid.org" if calendar is None else event_uid(calendar, event)
+        yield "BEGIN:VEVENT\r\n"
+        yield fold_line("DESCRIPTION:" + escape_text(event.description)) + "\r\n"
+        yield f"DTEND;VALUE=DATE:{event.end.strftime('%Y%m%d')}\r\n"
+        yield f"DTSTAMP:{stamp}\r\n"
+        yield f"DTSTART;VALUE=DATE:{event.begin.strftime('%Y%m%d')}\r\n"
+        yield fold_line("SUMMARY:" + escape_text(event.name)) + "\r\n"
+        yield "TRANSP:TRANSPARENT\r\n"
+        yield f"UID:{uid}\r\n"
+        yield "END:VEVENT\r\n"
+    yield "END:VCALENDAR\r\n"
+
+
+def serialize_events(events, dtstamp=None, calendar=None):
+    """
+    Returns the calendar holding the events as a string, as iter_ics_lines() writes it.
+    Args:
+        events (iterable): The MenuEvent objects.
+        dtstamp (datetime): The DTSTAMP of every event.
+        calendar (str): The name of the calendar, for deterministic output.
+    Returns:
+        str: The calendar.
+    """
+    return "".join(iter_ics_lines(events, dtstamp, calendar))
+
+
+def ics_digest(ics_string):
+    """
+    Returns the SHA-256 of a serialized calendar, as written to its file.
+    Args:
+        ics_string (str): The calendar.
+    Returns:
+        str: The hex digest.
+    """
+    return hashlib.sha256(ics_string.encode("utf-8")).hexdigest()
+
+
+def parse_date_value(value):
+    """
+    Returns the date of a DATE or DATE-TIME value, e.g. 20260504 or 20260504T000000Z.
+    """
+    return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+
+
+def read_events(ics_string):
+    """
+    Returns the events of a calendar of all-day menu events.
+    Understands the output of serialize_events() and of the ics library: folded lines, escaped text,
+    and DTSTART as a DATE or a DATE-TIME. Other properties and components are ignored.
+    Args:
+        ics_string (str): The calendar.
+    Returns:
+        list: The MenuEvent objects, in the order of the calendar.
+    """
+    events = []
+    current = None
+    # unfold: a line starting with a space or a tab continues the previous one
+    text = ics_string.replace("\r\n", "\n").replace("\n ", "").replace("\n\t", "")
+    for line in text.split("\n"):
+        name, _, value = line.partition(":")
+        name = name.split(";", 1)[0].upper()
+        if name == "BEGIN" and value == "VEVENT":
+            current = MenuEvent("", None, "")
+        elif current is None:
+            continue
+        elif name == "END" and value == "VEVENT":
+            if current.begin is not None:
+                events.append(current)
+            current = None
+        elif name == "SUMMARY":
+            current.name = unescape_text(value)
+        elif name == "DESCRIPTION":
+            current.description = unescape_text(value)
+        elif name == "DTSTART":
+            current.begin = parse_date_value(value)
+    return events
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+'''
+This module collects timings and counters for a run of pdf_2_ics.py or gcal.py and writes them out
+as a machine-readable report at the end of the run.
+Classes:
+    Metrics():
+        Thread-safe stage timers and labelled counters, with JSON and Prometheus textfile output.
+Functions:
+    get_metrics():
+        Returns the Metrics shared by this process.
+    span(stage):
+        Times a block of code as one call of a stage, in the shared Metrics.
+    count(name, amount, **labels):
+        Adds to a counter of the shared Metrics.
+    escape_label(value):
+        Escapes a label value for the Prometheus text format.
+    write_report(json_path, prometheus_path):
+        Writes the shared Metrics to a JSON file and, optionally, a Prometheus textfile.
+'''
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from atomic_file import atomic_write_text
+
+# Prefix of every metric name in the Prometheus textfile
+PROMETHEUS_PREFIX = "dps_menu"
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+class Metrics:
+    """
+    Stage timers and counters for one run.
+
+    A stage keeps its number of calls, total and longest duration. A counter is identified by its
+    name and labels, e.g. count("bytes_downloaded", 1024, document="K12_Lunch.pdf"). Worker
+    processes send their snapshot() back to be merged with merge().
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        """
+        Times the enclosed block as one call of stage.
+        Args:
+            stage (str): The stage name, e.g. "download".
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage, seconds):
+        """
+        Records one call of a stage.
+        Args:
+            stage (str): The stage name.
+            seconds (float): The time the call took.
+        """
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def count(self, name, amount=1, **labels):
+        """
+        Adds amount to a counter.
+        Args:
+            name (str): The counter name, e.g. "api_calls".
+            amount (int): The amount to add.
+            labels (str): Labels telling counters with the same name apart, e.g. calendar="...".
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def snapshot(self):
+        """
+        Returns the stages and counters as plain data, to be sent back from a worker process.
+        Returns:
+            dict: The stages and counters.
+        """
+        with self._lock:
+            return {
+                "stages": {stage: dict(entry) for stage, entry in self._stages.items()},
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+            }
+
+    def merge(self, snapshot):
+        """
+        Adds the stages and counters of another snapshot, e.g. from a worker process.
+        Args:
+            snapshot (dict): The result of snapshot().
+        """
+        with self._lock:
+            for stage, other in snapshot["stages"].items():
+                entry = self._stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+                entry["calls"] += other["calls"]
+                entry["seconds"] += other["seconds"]
+                entry["max_seconds"] = max(entry["max_seconds"], other["max_seconds"])
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(sorted(labels.items())))
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        """
+        Forgets every stage and counter, e.g. before a worker process takes its next job.
+        """
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+
+    def report(self):
+        """
+        Returns the run report.
+        Returns:
+            dict: The start time, wall time, stages and counters of the run, with totals per counter.
+        """
+        snapshot = self.snapshot()
+        totals = {}
+        for name, _, value in snapshot["counters"]:
+            totals[name] = totals.get(name, 0) + value
+        return {
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            "wall_seconds": time.time() - self.started,
+            "stages": snapshot["stages"],
+            "totals": totals,
+            "counters": [{"name": name, "labels": labels, "value": value}
+                         for name, labels, value in sorted(snapshot["counters"], key=lambda c: (c[0], sorted(c[1].items())))],
+        }
+
+    def to_prometheus(self):
+        """
+        Returns the run report in the Prometheus text exposition format, for the node_exporter textfile collector.
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        report = self.report()
+        lines = [f"# TYPE {PROMETHEUS_PREFIX}_run_seconds gauge",
+                 f"{PROMETHEUS_PREFIX}_run_seconds {report['wall_seconds']:.6f}",
+                 f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds_total counter",
+                 f"# TYPE {PROMETHEUS_PREFIX}_stage_calls_total counter"]
+        for stage, entry in sorted(report["stages"].items()):
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_total{{stage="{stage}"}} {entry["seconds"]:.6f}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_calls_total{{stage="{stage}"}} {entry["calls"]}')
+        typed = set()
+        for counter in report["counters"]:
+            metric = f"{PROMETHEUS_PREFIX}_{counter['name']}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            labels = ",".join(f'{key}="{escape_label(value)}"' for key, value in sorted(counter["labels"].items()))
+            lines.append(f"{metric}{{{labels}}} {counter['value']}" if labels else f"{metric} {counter['value']}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    """
+    Escapes a label value for the Prometheus text format.
+    Args:
+        value: The label value.
+    Returns:
+        str: The value with backslashes, quotes and newlines escaped.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def get_metrics():
+    """
+    Returns the Metrics shared by every thread of this process, created on first use.
+    Returns:
+        Metrics: The shared metrics.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+def span(stage):
+    """
+    Times a block of code as one call of stage, in the shared Metrics.
+    Args:
+        stage (str): The stage name.
+    Returns:
+        contextmanager: Use as "with span('download'):".
+    """
+    return get_metrics().span(stage)
+
+
+def count(name, amount=1, **labels):
+    """
+    Adds amount to a counter of the shared Metrics.
+    Args:
+        name (str): The counter name.
+        amount (int): The amount to add.
+        labels (str): The counter labels.
+    """
+    get_metrics().count(name, amount, **labels)
+
+
+def write_report(json_path, prometheus_path=None):
+    """
+    Writes the shared Metrics as a JSON run report and, optionally, as a Prometheus textfile.
+    Both files are written to a temporary file first and renamed, so a collector never reads half a file.
+    Args:
+        json_path (str): The JSON report path. Empty to skip it.
+        prometheus_path (str): The Prometheus textfile path, e.g. in node_exporter's textfile directory. Empty or None to skip it.
+    """
+    metrics = get_metrics()
+    outputs = []
+    if json_path:
+        outputs.append((json_path, json.dumps(metrics.report(), indent=1)))
+    if prometheus_path:
+        outputs.append((prometheus_path, metrics.to_prometheus()))
+    for path, text in outputs:
+        atomic_write_text(path, text)
@@ -4,68 +4,740 @@ This script retrieves links to PDF and DOCX files from a specified URL, extracts
 and generates ICS (iCalendar) files based on the extracted text. The script is designed to process school menu 
 documents and convert them into calendar events.
 Functions:
+    CountingRetry(...):
+        A urllib3 Retry that counts every retry in the run metrics.
+    get_session():
+        Returns the pooled, retrying HTTP session used for every download.
+    DocumentCache(directory, max_bytes):
+        A content-addressed cache of downloaded documents with conditional revalidation and LRU eviction.
+    get_document_cache():
+    ListingCache(path):
+        Remembers the links of each listing page, revalidating the page with ETag / Last-Modified.
+    get_listing_cache():
+    LinkStore(path):
+        A SQLite index of processed links with per-link metadata, exported to old_links.json.
+    extract_links(html):
+        Finds the document links in the JSON script block of a listing page.
+    get_listing(url):
+        Returns the document links of a listing page and whether it is unchanged since it was last fully processed.
     get_all_links(url):
     get_unique(url, links):
     get_all_pdfs(url, links):
     get_all_docs(url, links):
+    find_jobs(url, links):
+        Builds the generate_ics() jobs for the menus among a list of links.
+    document_date_hint(filename, listing_url):
+        Returns the month and year a menu is for, from its filename or the listing folder it was found in.
+    load_sources(path):
+        Loads the listing pages to scrape.
+    discover_jobs(sources, store, max_workers):
+        Fetches every listing page concurrently and builds the jobs for the links not processed yet.
+    fetch_document(url):
+    is_date_text(text):
+        Checks if a piece of text is a date line in any supported language.
+    page_fragments(page):
+        Extracts the text of a PDF page with the position of each piece, in one pass.
+    cluster_positions(values, tolerance):
+        Groups close coordinates together.
+    column_edges(anchors, fragments):
+        Works out the x-range of each column of a calendar grid from the spacing of its date lines.
+    layout_day_cells(fragments):
+        Buckets the text of a calendar page into its day cells, using the date lines as the grid.
+    docx_paragraph_text(paragraph):
+        Returns the text of a DOCX paragraph element, as python-docx would.
+    docx_table_cells(table):
+        Yields the text of each cell of a DOCX table element in grid order, each merged cell once.
+    iter_docx_tables(data):
+        Streams the top-level tables out of a DOCX file with an incremental XML parser.
+    iter_document_text(url, data):
+        Yields the text of a PDF page by page, or of a DOCX table by table.
+    document_to_text(url, data):
+    iter_url_text(url):
     url_to_text(url):
     is_valid_date(date_string, language):
         Checks if the input string is a valid date in the format "Month Day".
-    parse_date_string(date_string, language):
+    parse_date_string(date_string, language, year):
+    iter_lines(chunks):
+        Splits streamed text into lines, as str.split("\n") would split the whole text.
+    iter_menu_days(lines, day_language):
+        Splits menu text into (date, description lines) blocks in one pass.
+    resolve_menu_dates(month_days, date_hint, today):
+        Picks the year of each date of a menu from the date hint and the days of the week.
+    EmojiAnnotator(max_lines, lemma_table):
+        Adds emojis to menu lines through a per-language lookup table, with lemma and line caches.
+    get_emoji_annotator():
+    get_lemmatizer():
+        Returns the process-wide WordNet lemmatizer, created on first use.
+    load_lemma_table(path):
+        Loads the precomputed lemma table from lemmas.json.
     add_emojis(next_line, language, wnl):
-    text_to_ics(text, event_title, language, day_language):
+    text_to_events(text, event_title, language, day_language, date_hint):
+        Splits menu text into MenuEvent records, one per day.
+    get_ics_manifest():
+        Returns the digest manifest of the ICS files, or None if it is disabled.
+    get_calendar_archive():
+        Returns the month archive of the calendars, or None if it is disabled.
+    archive_ics(ics_string, filename):
+        Merges the events of an ICS file into the month archive of its calendar.
     to_file(ics_string, filename):
-    generate_ics(pdf_filename, level, language, day_language, meal):
+        Writes an ICS file and records its digest, leaving an unchanged file untouched.
+    menu_target(level, language, meal):
+    clean_link(filename):
+    document_to_ics(link, data, event_title, language, day_language, outfile, date_hint):
+    document_to_ics_with_metrics(link, data, event_title, language, day_language, outfile, date_hint):
+        Runs document_to_ics() in a worker process and returns its metrics with the result.
+    generate_ics(pdf_filename, level, language, day_language, meal, date_hint):
+    generate_all_ics(jobs, max_workers, store):
+        Downloads and parses a batch of menus concurrently, bounded by DPS_MAX_WORKERS.
+    document_name(link):
+        Returns the filename part of a document URL, used to label its metrics.
+    compile_filename_rules():
+        Compiles the tokens of every filename rule into one regular expression.
+    classify_filename(filename):
+        Classifies a filename with the rule tables, returning the result with a confidence and a reason.
     parse_filename(filename):
 Main Execution:
     The script retrieves links from a specified URL, processes DOCX and PDF files to extract text content, 
     and generates ICS files based on the extracted text. The generated ICS files contain calendar events 
     for school menus, with event titles and descriptions based on the content of the documents.
 '''
+import multiprocessing
+import os
 import re
-from datetime import datetime, timezone
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import date, datetime, timezone
 from io import BytesIO
 from urllib.parse import urljoin
-from urllib.request import urlopen
+import hashlib
 import json
-import emoji
-import ics
+import threading
+import time
+import unicodedata
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
 import requests
-from bs4 import BeautifulSoup
-from nltk.stem import WordNetLemmatizer
-from pypdf import PdfReader
-import docx
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import metrics
+from atomic_file import atomic_write_bytes, atomic_write_json, atomic_write_text
+from menu_calendar import CalendarArchive, DigestManifest, MenuEvent, ics_digest, read_events, serialize_events
+# emoji, bs4, nltk and pypdf are imported where they are used, so that a run
+# with no new links to process does not pay for loading them
 
+# Maximum number of documents downloaded and parsed at the same time
+MAX_WORKERS = int(os.environ.get("DPS_MAX_WORKERS", "8"))
+# Seconds to wait for the server to connect and to send data
+REQUEST_TIMEOUT = (10, 60)
 
-def get_all_links(url):
+# Where downloaded documents are cached, and how many bytes the cache may hold
+CACHE_DIR = os.environ.get("DPS_CACHE_DIR", os.path.join(".cache", "documents"))
+CACHE_MAX_BYTES = int(os.environ.get("DPS_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+# Where the links found on each listing page are remembered, with the page's validators and hash
+LISTING_CACHE_JSON = os.environ.get("DPS_LISTING_CACHE", os.path.join(".cache", "listings.json"))
+# SQLite database recording every processed link, kept with the caches so CI restores it, and its
+# JSON export kept in the repository
+STATE_DB = os.environ.get("DPS_STATE_DB", os.path.join(".cache", "links.db"))
+OLD_LINKS_JSON = "old_links.json"
+# Serve cached documents without revalidating them against the server
+OFFLINE = os.environ.get("DPS_OFFLINE", "") not in ("", "0")
+# JSON list of the listing pages to scrape, each {"name": ..., "url": ...}
+SOURCES_JSON = os.environ.get("DPS_SOURCES", "sources.json")
+# Run report written at the end of a run, as JSON and, if a path is set, as a Prometheus textfile
+REPORT_JSON = os.environ.get("DPS_REPORT_JSON", "pdf_2_ics_report.json")
+REPORT_PROMETHEUS = os.environ.get("DPS_REPORT_PROMETHEUS", "")
+# Write reproducible ICS files (sorted events, UIDs derived from the content, fixed DTSTAMP); 0 for random UIDs
+DETERMINISTIC_ICS = os.environ.get("DPS_DETERMINISTIC_ICS", "1") not in ("", "0")
+# SHA-256 of every ICS file written, published with the files; empty to disable it
+ICS_MANIFEST_JSON = os.environ.get("DPS_ICS_MANIFEST", "ics_manifest.json")
+# Every event of each calendar by month, with a rolling one-year ICS file per calendar, published
+# with the GitHub Pages site; empty to disable it
+ARCHIVE_DIR = os.environ.get("DPS_ARCHIVE_DIR", os.path.join("docs", "calendars"))
+# Months before the current one that the rolling ICS files still cover
+ARCHIVE_MONTHS = int(os.environ.get("DPS_ARCHIVE_MONTHS", "11"))
+# Read PDF menus cell by cell from the calendar grid instead of as flat text (off until it matches
+# flat text on the real menus, see benchmarks/pdf_layout.py)
+PDF_LAYOUT = os.environ.get("DPS_PDF_LAYOUT", "0") not in ("", "0")
+
+# Month names in each supported language, used to recognize the date lines of a menu
+MONTH_NAMES = {
+    "en": ["January", "February", "March", "April", "May", "June",
+           "July", "August", "September", "October", "November", "December"],
+    "es": ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+           "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"],
+}
+MONTH_NUMBERS = {
+    language: {name: number for number, name in enumerate(names, start=1)}
+    for language, names in MONTH_NAMES.items()
+}
+DATE_PATTERNS = {
+    language: re.compile(r"^(" + "|".join(names) + r")\s+(\d{1,2})$")
+    for language, names in MONTH_NAMES.items()
+}
+# Month of each English or Spanish month name in filenames and listing folders, by its first three letters
+HINT_MONTHS = {
+    "jan": 1, "ene": 1, "feb": 2, "mar": 3, "apr": 4, "abr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "ago": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12, "dic": 12,
+}
+# A month name, whole or in three letters, followed by a year, e.g. "Apr25", "ClasesMay26", "Octubre__24",
+# "January-2026" or "may-2026", possibly with a day in between ("May-4-2026"). The month may follow a
+# word, but no letter may follow it. A two-digit year must be in 20-40, and a number followed by a year
+# is the day, so neither "Enero_15" nor the day of "Jan_20_2026" is taken for the year, while the
+# grades of "Noviembre_24_6-8" are not taken for a date.
+HINT_MONTH_NAMES = sorted(set(MONTH_NAMES["en"] + MONTH_NAMES["es"] + list(HINT_MONTHS) + ["Sept"]), key=len, reverse=True)
+MONTH_YEAR_PATTERN = re.compile(
+    r"(?<!\d)(" + "|".join(HINT_MONTH_NAMES) + r")(?![a-z])[-_ .]*(?:\d{1,2}(?:st|nd|rd|th)?[-_ ,.]+)?"
+    r"(20\d\d|[23]\d|40)(?!\d)",
+    re.IGNORECASE,
+)
+# A line containing any of these ends the description of a day (price and menu-change notes)
+STOP_WORDS = ("Prices", "Precios", "ambios", "change")
+# Distances in PDF points: pieces of text closer than LINE_TOLERANCE vertically are on the same line,
+# and date lines closer than ROW_TOLERANCE / COLUMN_TOLERANCE are in the same row / column of the grid
+LINE_TOLERANCE = 3.0
+ROW_TOLERANCE = 6.0
+COLUMN_TOLERANCE = 20.0
+# Namespace of the WordprocessingML elements in word/document.xml
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# Text of the run elements other than w:t, as python-docx reads them
+DOCX_RUN_TEXT = {
+    WORD_NAMESPACE + "tab": "\t",
+    WORD_NAMESPACE + "ptab": "\t",
+    WORD_NAMESPACE + "cr": "\n",
+    WORD_NAMESPACE + "noBreakHyphen": "-",
+}
+# The ":name:" shortcodes emoji.emojize() recognizes, with the same set of name characters
+EMOJI_NAME_PATTERN = re.compile(
+    "(:[\\w\\-&.\u2019\u201d\u201c()!#*+,/\u00ab\u00bb\u0300\u0301\u0302\u0303\u0306\u0308\u030a"
+    "\u0327\u064b\u064e\u064f\u0650\u0653\u0654\u3099\u30fb\u309a\u0655]+:)"
+)
+
+# The first <script type="application/json"> block of a listing page, and its content
+JSON_SCRIPT_PATTERN = re.compile(
+    r"""<script\b[^>]*?\stype\s*=\s*["']?application/json["']?[^>]*>(.*?)</script\s*>""", re.IGNORECASE | re.DOTALL
+)
+
+# Filename classification rules, each list in priority order: the first token found in a filename wins.
+# Filenames with any of these tokens are not menus (carb counts, achievement menus).
+FILENAME_EXCLUDE_TOKENS = ("Carb", "Achievement")
+# (token, level). "After" and "Breakfast" only say which menu it is, not the school level.
+FILENAME_LEVEL_RULES = (
+    ("K12", "k12"), ("K-12", "k12"),
+    ("ES", "elementary"), ("Elementary", "elementary"), ("Primaria", "elementary"),
+    ("MS", "middle"), ("Intermedia", "middle"), ("Middle", "middle"),
+    ("HS", "high"), ("Secundaria", "high"), ("High", "high"),
+    ("BIC", "bic"), ("Aula", "bic"), ("Classroom", "bic"),
+    ("After", "k12"),
+    ("PreK", "prek"), ("Pre-K", "prek"), ("Prek", "prek"),
+    ("Breakfast", "k12"),
+)
+FILENAME_GENERIC_LEVEL_TOKENS = ("After", "Breakfast")
+# (token, meal, language the token implies or None)
+FILENAME_MEAL_RULES = (
+    ("Breakfast", "breakfast", None), ("Desayuno", "breakfast", "es"),
+    ("Lunch", "lunch", None), ("Almuerzo", "lunch", "es"), ("Escuela-Primaria", "lunch", "es"),
+    ("ASSP", "afterschoolsnack", "en"), ("After", "afterschoolsnack", None), ("Despu", "afterschoolsnack", "es"),
+    ("Snack", "snack", None), ("Merienda", "snack", "es"),
+)
+# Marks a Spanish menu whatever the other tokens say
+FILENAME_SPANISH_TOKEN = "Spanish"
+
+# Precomputed WordNet lemmas of common menu words, so most lines never need WordNet itself
+LEMMAS_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lemmas.json")
+
+_session = None
+_document_cache = None
+_listing_cache = None
+_ics_manifest = None
+_calendar_archive = None
+_emoji_annotator = None
+_lemmatizer = None
+
+
+class CountingRetry(Retry):
+    """
+    A Retry that adds each retry it allows to the http_retries counter of the run metrics.
+    """
+
+    def increment(self, *args, **kwargs):
+        metrics.count("http_retries")
+        return super().increment(*args, **kwargs)
+
+
+def get_session():
+    """
+    Returns the HTTP session shared by every download in this module.
+    The session is created on first use. It keeps connections alive and pools them per host,
+    so a batch of documents from the same S3 bucket reuses one TLS connection per worker
+    instead of opening a new one per document. Connection errors and 429/5xx responses are
+    retried with exponential backoff. requests already asks for and decodes gzip responses.
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    if _session is None:
+        retry = CountingRetry(
+            total=3,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(MAX_WORKERS, 1), max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+
+class DocumentCache:
+    """
+    A content-addressed on-disk cache of downloaded documents.
+
+    Each document body is stored once under objects/<sha256>, and index.json maps every URL
+    to the hash of its body plus the ETag and Last-Modified headers the server sent with it.
+    Cached URLs are revalidated with If-None-Match / If-Modified-Since, so an unchanged
+    document costs a 304 instead of a full download. When the cache grows past max_bytes,
+    the least recently used documents are evicted. It is safe to use from several threads.
+    """
+
+    def __init__(self, directory, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "evicted": 0, "bytes_downloaded": 0}
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(directory, "index.json")
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r") as f:
+                self._index = json.load(f)
+        else:
+            self._index = {}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+        # bytes_downloaded is the same counter whether or not the cache is enabled
+        metrics.count(name if name == "bytes_downloaded" else "document_cache_" + name, amount)
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest)
+
+    def _save_index(self):
+        atomic_write_json(self._index_path, self._index)
+
+    def _read(self, url):
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None or not os.path.exists(self._object_path(entry["sha256"])):
+                return None, None
+            entry["last_used"] = time.time()
+            with open(self._object_path(entry["sha256"]), "rb") as f:
+                return entry, f.read()
+
+    def _store(self, url, data, headers):
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            path = self._object_path(digest)
+            if not os.path.exists(path):
+                atomic_write_bytes(path, data)
+            self._index[url] = {
+                "sha256": digest,
+                "size": len(data),
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "last_used": time.time(),
+            }
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        # bodies are shared between URLs with identical content, so count each hash once
+        sizes = {}
+        for entry in self._index.values():
+            sizes[entry["sha256"]] = entry["size"]
+        total = sum(sizes.values())
+        for url, entry in sorted(self._index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            del self._index[url]
+            self.stats["evicted"] += 1
+            if all(other["sha256"] != entry["sha256"] for other in self._index.values()):
+                total -= entry["size"]
+                if os.path.exists(self._object_path(entry["sha256"])):
+                    os.remove(self._object_path(entry["sha256"]))
+
+    def get(self, url, session, offline=OFFLINE):
+        """
+        Returns the body of url, from the cache when it is still current.
+        Args:
+            url (str): The URL of the document.
+            session (requests.Session): The session used for downloads and revalidation.
+            offline (bool): If True, return a cached copy without asking the server.
+        Returns:
+            bytes: The document body.
+        Raises:
+            requests.exceptions.RequestException: If the HTTP request fails.
+        """
+        entry, data = self._read(url)
+        if data is not None and offline:
+            self._count("hits")
+            return data
+        headers = {}
+        if entry is not None and data is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304 and data is not None:
+            self._count("hits")
+            self._count("revalidated")
+            return data
+        response.raise_for_status()
+        self._count("misses")
+        self._count("bytes_downloaded", len(response.content))
+        self._store(url, response.content, response.headers)
+        return response.content
+
+
+def get_document_cache():
+    """
+    Returns the document cache shared by every download in this module, or None if it is disabled.
+    Set DPS_CACHE_DIR to an empty string to disable caching.
+    Returns:
+        DocumentCache: The shared cache, created on first use.
+    """
+    global _document_cache
+    if _document_cache is None and CACHE_DIR:
+        _document_cache = DocumentCache(CACHE_DIR)
+    return _document_cache
+
+
+class ListingCache:
+    """
+    The links found on each listing page, kept between runs.
+
+    For each page URL, a JSON file records the ETag and Last-Modified headers, the SHA-256 of the
+    HTML and the links extracted from it. The page is revalidated with If-None-Match /
+    If-Modified-Since; a 304, or a new download whose hash has not changed, returns the recorded
+    links without extracting them again. Once every link of a page has been processed,
+    mark_complete() records it, and until the page changes again get_links() reports it as
+    unchanged, so the run can skip it. It is safe to use from several threads.
+    """
+
+    def __init__(self, path=LISTING_CACHE_JSON):
+        self.path = path
+        self.stats = {"unchanged": 0, "changed": 0}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self._index = json.load(f)
+        else:
+            self._index = {}
+
+    def _save(self):
+        atomic_write_json(self.path, self._index)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+        metrics.count("listing_" + name)
+
+    def get_links(self, url, session, offline=OFFLINE):
+        """
+        Returns the document links of a listing page, extracting them only when the page changed.
+        Args:
+            url (str): The URL of the listing page.
+            session (requests.Session): The session used for downloads and revalidation.
+            offline (bool): If True, return the recorded links without asking the server.
+        Returns:
+            tuple: The links, as returned by extract_links(), and True if the page has not changed
+            since mark_complete() was last called for it.
+        Raises:
+            requests.exceptions.RequestException: If the HTTP request fails.
+        """
+        with self._lock:
+            entry = self._index.get(url)
+        if entry is not None and offline:
+            self._count("unchanged")
+            return entry["links"], entry.get("complete", False)
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304 and entry is not None:
+            self._count("unchanged")
+            return entry["links"], entry.get("complete", False)
+        response.raise_for_status()
+        metrics.count("listing_bytes_downloaded", len(response.content))
+        digest = hashlib.sha256(response.content).hexdigest()
+        unchanged = entry is not None and entry["sha256"] == digest
+        if unchanged:
+            self._count("unchanged")
+            links = entry["links"]
+        else:
+            self._count("changed")
+            links = extract_links(response.text)
+        complete = unchanged and entry.get("complete", False)
+        with self._lock:
+            self._index[url] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "sha256": digest,
+                "links": links,
+                "complete": complete,
+            }
+            self._save()
+        return links, complete
+
+    def mark_complete(self, url):
+        """
+        Records that every link of a listing page has been processed, so that get_links() reports the
+        page as unchanged until its content changes.
+        Args:
+            url (str): The URL of the listing page.
+        Returns:
+            None
+        """
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is not None and not entry.get("complete"):
+                entry["complete"] = True
+                self._save()
+
+
+def get_listing_cache():
+    """
+    Returns the listing cache shared by this module, or None if it is disabled.
+    Set DPS_LISTING_CACHE to an empty string to disable it.
+    Returns:
+        ListingCache: The shared cache, created on first use.
+    """
+    global _listing_cache
+    if _listing_cache is None and LISTING_CACHE_JSON:
+        _listing_cache = ListingCache(LISTING_CACHE_JSON)
+    return _listing_cache
+
+
+class LinkStore:
+    """
+    A SQLite index of every document link that has been processed.
+
+    Each link is stored once with the SHA-256 of its content, when it was processed, the ICS
+    file it was written to, the date hint of its job, and its parse status ("ok", "skipped" for
+    links parse_filename()
+    rejects, or "failed" for documents that could not be downloaded or parsed). Membership checks
+    are primary-key lookups, and every record() is its own transaction, so a crash mid-run keeps
+    everything finished before it. A failed link does not count as processed, so the next run
+    tries it again. old_links.json stays the portable copy: import_json() loads it and
+    export_json() rewrites it in the same format, without the failed links.
+    """
+
+    def __init__(self, path=STATE_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS links (
+                    link TEXT PRIMARY KEY,
+                    sha256 TEXT,
+                    processed_at TEXT,
+                    outfile TEXT,
+                    status TEXT,
+                    date_hint TEXT
+                )"""
+            )
+            # stores created before date hints were recorded
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(links)")]
+            if "date_hint" not in columns:
+                self._conn.execute("ALTER TABLE links ADD COLUMN date_hint TEXT")
+
+    def __contains__(self, link):
+        row = self._conn.execute("SELECT 1 FROM links WHERE link = ? AND status IS NOT 'failed'", (link,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+
+    def record(self, link, sha256=None, outfile=None, status="ok", date_hint=None):
+        """
+        Records a processed link, replacing any earlier record of it.
+        Args:
+            link (str): The document link, as found on the listing page.
+            sha256 (str): The SHA-256 of the document content.
+            outfile (str): The ICS file the document was written to.
+            status (str): The parse status of the document.
+            date_hint (tuple): The (year, month) the menu is for, from its job, or None.
+        Returns:
+            None
+        """
+        processed_at = datetime.now(timezone.utc).isoformat()
+        hint = "%04d-%02d" % date_hint if date_hint else None
+        with self._conn:
+            self._conn.execute(
+                """INSERT INTO links (link, sha256, processed_at, outfile, status, date_hint) VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(link) DO UPDATE SET sha256 = excluded.sha256, processed_at = excluded.processed_at,
+                   outfile = excluded.outfile, status = excluded.status, date_hint = excluded.date_hint""",
+                (link, sha256, processed_at, outfile, status, hint),
+            )
+
+    def record_new(self, links, status):
+        """
+        Records links that are not in the store yet, without metadata.
+        Args:
+            links (list): The document links.
+            status (str): The status to record for them.
+        Returns:
+            None
+        """
+        processed_at = datetime.now(timezone.utc).isoformat()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO links (link, processed_at, status) VALUES (?, ?, ?)",
+                [(link, processed_at, status) for link in links],
+            )
+
+    def get(self, link):
+        """
+        Returns the record of a link.
+        Args:
+            link (str): The document link.
+        Returns:
+            dict: The stored columns of the link, or None if it has not been processed.
+        """
+        cursor = self._conn.execute("SELECT * FROM links WHERE link = ?", (link,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    def date_hint(self, link):
+        """
+        Returns the date hint recorded with a link.
+        Args:
+            link (str): The document link.
+        Returns:
+            tuple: The (year, month) the menu is for, or None if none was recorded.
+        """
+        row = self._conn.execute("SELECT date_hint FROM links WHERE link = ?", (link,)).fetchone()
+        if row is None or not row[0]:
+            return None
+        (year, month) = row[0].split("-")
+        return int(year), int(month)
+
+    def links(self, include_failed=True):
+        """
+        Args:
+            include_failed (bool): If False, leave out the links whose download or parse failed.
+        Returns:
+            list: Every recorded link, oldest first.
+        """
+        query = "SELECT link FROM links" + ("" if include_failed else " WHERE status IS NOT 'failed'")
+        return [row[0] for row in self._conn.execute(query + " ORDER BY rowid")]
+
+    def import_json(self, path=OLD_LINKS_JSON):
+        """
+        Adds the links from a JSON list file (old_links.json) that are not in the store yet.
+        Args:
+            path (str): The JSON file to read. Nothing happens if it does not exist.
+        Returns:
+            None
+        """
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.record_new(json.load(f), status="imported")
+
+    def export_json(self, path=OLD_LINKS_JSON):
+        """
+        Writes every recorded link but the failed ones to a JSON list file, atomically.
+        Args:
+            path (str): The JSON file to write.
+        Returns:
+            None
+        """
+        atomic_write_json(path, self.links(include_failed=False))
+
+
+def extract_links(html):
+    """
+    Extracts the links of uploaded files from the JSON object embedded within
+    the first script tag of type 'application/json' in the HTML content of a listing page.
+    The script block is located with a regular expression, which is much cheaper than building
+    a BeautifulSoup tree of these large CMS pages; BeautifulSoup is only used if that fails.
+    Args:
+        html (str): The HTML content of the page.
+    Returns:
+        list: A list of strings containing links that include "uploaded_file".
+    Raises:
+        AttributeError: If the expected script tag or JSON content is not found.
+        json.JSONDecodeError: If the JSON content cannot be parsed.
+    """
+    match = JSON_SCRIPT_PATTERN.search(html)
+    try:
+        data = json.loads(match.group(1))
+    except (AttributeError, ValueError):
+        from bs4 import BeautifulSoup
+
+        # Parse the HTML content
+        soup = BeautifulSoup(html, "html.parser")
+        # Find script tag with type 'application/json'
+        script_tag = soup.find('script', type='application/json')
+        # Get script tag content
+        json_string = script_tag.string
+        # Load JSON data
+        data = json.loads(json_string)
+    # Extract links from the JSON data list
+    return [a for a in data if type(a) == str and "uploaded_file" in a]
+
+
+def get_listing(url):
     """
-    Extracts all links containing "amazonaws.com" from a JSON object embedded 
-    within a script tag of type 'application/json' in the HTML content of a given URL.
+    Fetches one listing page and returns the document links on it, with extract_links().
+    With the listing cache enabled, the page is revalidated with the ETag and Last-Modified of the
+    last download: a 304 response or an unchanged body returns the recorded links without parsing
+    the page again, and DPS_OFFLINE returns them without a request. Otherwise the page is downloaded
+    and parsed every time.
     Args:
-        url (str): The URL of the webpage to scrape for links.
+        url (str): The URL of the listing page.
     Returns:
-        list: A list of strings containing links that include "amazonaws.com".
+        tuple: The links of the uploaded files on the page, and True if the page is unchanged since
+        all of its links were processed (see ListingCache.mark_complete()); always False without the
+        cache.
     Raises:
         requests.exceptions.RequestException: If the HTTP request fails.
         requests.exceptions.HTTPError: If the HTTP response contains an error status code.
         AttributeError: If the expected script tag or JSON content is not found.
         json.JSONDecodeError: If the JSON content cannot be parsed.
     """
-    # Send an HTTP GET request to the URL
-    response = requests.get(url)
-    # Check if the request was successful
-    response.raise_for_status()
-    # Parse the HTML content
-    soup = BeautifulSoup(response.text, "html.parser")
-    # Find script tag with type 'application/json'
-    script_tag = soup.find('script', type='application/json')
-    # Get script tag content
-    json_string = script_tag.string
-    # Load JSON data
-    data = json.loads(json_string)
-    # Extract links from the JSON data list
-    links = [a for a in data if type(a) == str and "uploaded_file" in a]
-    return links
+    with metrics.span("get_all_links"):
+        cache = get_listing_cache()
+        if cache:
+            (links, unchanged) = cache.get_links(url, get_session())
+        else:
+            # Send an HTTP GET request to the URL
+            response = get_session().get(url, timeout=REQUEST_TIMEOUT)
+            # Check if the request was successful
+            response.raise_for_status()
+            metrics.count("listing_bytes_downloaded", len(response.content))
+            (links, unchanged) = (extract_links(response.text), False)
+    metrics.count("links_found", len(links))
+    return links, unchanged
+
+
+def get_all_links(url):
+    """
+    Returns the document links of a listing page, as get_listing() finds them.
+    Args:
+        url (str): The URL of the listing page.
+    Returns:
+        list: The links of the uploaded files on the page.
+    """
+    return get_listing(url)[0]
 
 
 def get_unique(url, links):
@@ -73,14 +745,14 @@ def get_unique(url, links):
     Generates a list of unique URLs from the given base URL and list of links.
     This function filters the provided list of links to include only those that
     end with ".pdf" or ".docs", then joins each link with the base URL and 
-    returns a list of unique URLs.
+    returns a sorted list of unique URLs.
     Args:
         url (str): The base URL to join with each link.
         links (list): A list of link strings to be filtered and joined with the base URL.
     Returns:
         list: A list of unique URLs that end with ".pdf" or ".docx".
     """
-    unique_links = list(
+    unique_links = sorted(
         set([urljoin(url, file) for file in links if (file.endswith(".pdf") or file.endswith(".docx"))])
     )
     return unique_links
@@ -93,9 +765,9 @@ def get_all_pdfs(url, links):
         url (str): The base URL to join with the PDF file links.
         links (list): A list of file links to filter and join with the base URL.
     Returns:
-        list: A list of unique PDF URLs.
+        list: A sorted list of unique PDF URLs.
     """
-    pdfs = list(
+    pdfs = sorted(
         set([urljoin(url, file) for file in links if ".pdf" in file])
     )
     return pdfs
@@ -110,14 +782,429 @@ def get_all_docs(url, links):
         links (list): A list of links to filter and join with the base URL.
 
     Returns:
-        list: A list of unique .docx document URLs.
+        list: A sorted list of unique .docx document URLs.
     """
-    docs = list(
+    docs = sorted(
         set([file for file in links if ".docx" in file])
     )
     return docs
 
 
+def find_jobs(url, links):
+    """
+    Builds the generate_ics() jobs for the menus among a list of links, DOCX files first and then PDFs.
+    The date hint of each job is worked out here, while the listing page is known.
+    Args:
+        url (str): The listing page the links were found on.
+        links (list): The links to consider, usually the ones not processed yet.
+    Returns:
+        list: A list of (filename, level, language, day_language, meal, date_hint) tuples, as passed to
+        generate_all_ics().
+    """
+    jobs = []
+    for filename in get_all_docs(url, links) + get_all_pdfs(url, links):
+        params = parse_filename(filename)
+        if params:
+            print(filename)
+            (level, language, meal) = params
+            jobs.append((filename, level, language, language, meal, document_date_hint(filename, url)))
+    return jobs
+
+
+def document_date_hint(filename, listing_url=None):
+    """
+    Returns the month and year a menu is for, as far as its name tells: the month and year in the
+    filename ("DPS_BIC_Breakfast_Apr25.pdf"), or else in the folder of the listing page it was found on
+    (".../may-2026/...").
+    Args:
+        filename (str): The filename (URL) of the menu.
+        listing_url (str): The listing page the menu was found on, if known.
+    Returns:
+        tuple: The (year, month) of the menu, or None if neither says.
+    """
+    for text in (document_name(filename), listing_url or ""):
+        match = MONTH_YEAR_PATTERN.search(text)
+        if match:
+            year = int(match.group(2))
+            return (year + 2000 if year < 100 else year), HINT_MONTHS[match.group(1)[:3].lower()]
+    return None
+
+
+def load_sources(path=SOURCES_JSON):
+    """
+    Loads the list of listing pages to scrape.
+    Args:
+        path (str): The JSON file holding the list, each entry a {"name": ..., "url": ...} object.
+    Returns:
+        list: The sources, in the order of the file.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def discover_jobs(sources, store, max_workers=MAX_WORKERS):
+    """
+    Fetches every listing page concurrently, merges their links and builds the jobs for the new ones.
+    A link listed by several sources is only processed once, for the first of them. A listing page
+    that cannot be fetched is reported and skipped, so one broken source does not stop the run.
+    A page that has not changed since all of its links were processed is skipped without looking at
+    its links; a page whose links are all processed already is marked so in the listing cache.
+    Args:
+        sources (list): The sources, as returned by load_sources().
+        store (LinkStore): The processed links, which are left out.
+        max_workers (int): The number of listing pages fetched at the same time.
+    Returns:
+        tuple: The jobs (list of tuples, as passed to generate_all_ics()) and the new links (list of str).
+    """
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(sources)), 1)) as pool:
+        listings = [pool.submit(get_listing, source["url"]) for source in sources]
+        jobs = []
+        new_links = []
+        seen = set()
+        for source, listing in zip(sources, listings):
+            try:
+                (links, unchanged) = listing.result()
+            except Exception as e:
+                print(f"Skipping {source['name']}: {e}")
+                metrics.count("listing_failures", source=source["name"])
+                continue
+            if unchanged:
+                metrics.count("listing_skipped", source=source["name"])
+                continue
+            links = [link for link in links if link not in store]
+            if not links and get_listing_cache():
+                get_listing_cache().mark_complete(source["url"])
+            links = [link for link in links if link not in seen]
+            seen.update(links)
+            jobs += find_jobs(source["url"], links)
+            new_links += links
+    return jobs, new_links
+
+
+def fetch_document(url):
+    """
+    Downloads the raw bytes of a PDF or DOCX file, going through the document cache when it is enabled.
+
+    Args:
+        url (str): The URL of the file to download. The URL should end with either ".pdf" or ".docx".
+
+    Returns:
+        bytes: The content of the file. Returns None if the URL does not end with ".pdf" or ".docx".
+
+    Raises:
+        requests.exceptions.RequestException: If the HTTP request fails.
+    """
+    if not (url.endswith(".pdf") or url.endswith(".docx")):
+        return None
+    with metrics.span("download"):
+        cache = get_document_cache()
+        if cache:
+            data = cache.get(url, get_session())
+        else:
+            response = get_session().get(url, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            data = response.content
+            metrics.count("bytes_downloaded", len(data))
+    metrics.count("document_bytes", len(data), document=document_name(url))
+    return data
+
+
+def is_date_text(text):
+    """
+    Checks if a piece of text is a date line ("May 4", "Mayo 4") in any supported language.
+    Args:
+        text (str): The stripped text.
+    Returns:
+        bool: True if the text is a date.
+    """
+    return any(pattern.match(text) for pattern in DATE_PATTERNS.values())
+
+
+def page_fragments(page):
+    """
+    Extracts the text of a PDF page in one pass over its content stream, keeping where each piece is.
+    Args:
+        page (pypdf.PageObject): The page.
+    Returns:
+        tuple: The flat text, as page.extract_text() returns it, and a list of (x, y, text) fragments,
+        x and y being the start of the text in page space (points, y growing upwards).
+    """
+    fragments = []
+
+    def visitor(text, cm, tm, font_dict, font_size):
+        if not text.strip():
+            return
+        # text space to page space: the text matrix times the current transformation matrix
+        x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+        y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+        line_height = 1.2 * (font_size or 10) * (abs(tm[3] * cm[3]) or 1)
+        for offset, line in enumerate(text.split("\n")):
+            if line.strip():
+                fragments.append((x, y - offset * line_height, " ".join(line.split())))
+
+    text = page.extract_text(visitor_text=visitor)
+    return text, fragments
+
+
+def cluster_positions(values, tolerance):
+    """
+    Groups coordinates that are within tolerance of the previous one.
+    Args:
+        values (iterable): The coordinates.
+        tolerance (float): The largest gap inside a group.
+    Returns:
+        list: The mean of each group, in increasing order.
+    """
+    clusters = []
+    for value in sorted(values):
+        if clusters and value - clusters[-1][-1] <= tolerance:
+            clusters[-1].append(value)
+        else:
+            clusters.append([value])
+    return [sum(cluster) / len(cluster) for cluster in clusters]
+
+
+def column_edges(anchors, fragments):
+    """
+    Works out the x-range of each column of a calendar grid from the spacing of its date lines.
+    The date lines of a column are clustered into one anchor, and every cell holds its date at the same
+    place, so each column starts the same distance before its anchor. That distance is found from the
+    first column: its left edge is where the leftmost piece of text of the grid starts, whether the
+    dates are left-aligned, centered or right-aligned. The last column is as wide as the one before it.
+    Args:
+        anchors (list): The (x, y, text) fragments of the date lines.
+        fragments (list): The (x, y, text) fragments between the top and the bottom of the grid.
+    Returns:
+        list: The x of the left edge of each column, then the right edge of the last one.
+    """
+    columns = cluster_positions((x for x, _, _ in anchors), COLUMN_TOLERANCE)
+    if len(columns) < 2:
+        return [float("-inf"), float("inf")]
+    pitch = min(right - left for left, right in zip(columns, columns[1:]))
+    # text left of the first anchor by more than a column width is not part of the grid
+    first_start = min(x for x, _, _ in fragments if x > columns[0] - pitch)
+    offset = columns[0] - first_start + COLUMN_TOLERANCE / 2
+    edges = [column - offset for column in columns]
+    return edges + [edges[-1] + columns[-1] - columns[-2]]
+
+
+def layout_day_cells(fragments):
+    """
+    Buckets the text of a calendar page into its day cells, in one pass over the fragments.
+    The date lines ("May 4") anchor the grid: column_edges() turns their x positions into the x-range of
+    each column, and their y positions give the rows. A fragment belongs to the column whose range it
+    starts in and to the row whose date is the nearest one above it. The last row is as tall as the
+    others, and nothing above the first row or outside the columns belongs to a cell, so titles, weekday
+    headers and footnotes around the grid are left out without looking for STOP_WORDS.
+    Args:
+        fragments (list): The (x, y, text) fragments of the page, from page_fragments().
+    Returns:
+        list: One list of lines per day cell, starting with its date, in the order of the calendar;
+        or None if the page does not look like a calendar grid.
+    """
+    anchors = [fragment for fragment in fragments if is_date_text(fragment[2])]
+    if len(anchors) < 2:
+        return None
+    rows = cluster_positions((y for _, y, _ in anchors), ROW_TOLERANCE)[::-1]
+    # the bottom of the last row, from the usual row height
+    row_height = (rows[0] - rows[-1]) / (len(rows) - 1) if len(rows) > 1 else float("inf")
+    bottom = rows[-1] - row_height
+
+    def in_grid(y):
+        return bottom + ROW_TOLERANCE < y <= rows[0] + ROW_TOLERANCE
+
+    edges = column_edges(anchors, [fragment for fragment in fragments if in_grid(fragment[1])])
+    if len(edges) < 3 and len(rows) < 2:
+        return None
+
+    def cell_of(x, y):
+        if not in_grid(y) or not edges[0] <= x < edges[-1]:
+            return None
+        row = next(index for index, top in enumerate(rows)
+                   if index == len(rows) - 1 or y > rows[index + 1] + ROW_TOLERANCE)
+        return row, bisect_right(edges, x) - 1
+
+    cells = {}
+    for x, y, text in anchors:
+        key = cell_of(x, y)
+        # a second date in a cell stays in its text, where iter_menu_days() still splits on it
+        if key is not None and (key not in cells or y > cells[key][0][1]):
+            cells[key] = [(x, y, text)]
+    anchor_set = set(cells[key][0] for key in cells)
+    for fragment in fragments:
+        key = cell_of(fragment[0], fragment[1])
+        if key in cells and fragment not in anchor_set:
+            cells[key].append(fragment)
+
+    result = []
+    for key in sorted(cells):
+        (anchor, *pieces) = cells[key]
+        lines = [anchor[2]]
+        current_y = None
+        for x, y, text in sorted(pieces, key=lambda piece: (-piece[1], piece[0])):
+            if current_y is not None and abs(current_y - y) <= LINE_TOLERANCE:
+                lines[-1] += " " + text
+            else:
+                lines.append(text)
+                current_y = y
+        result.append(lines)
+    return result
+
+
+def docx_paragraph_text(paragraph):
+    """
+    Returns the text of a w:p element, as python-docx's Paragraph.text reads it: the runs of the
+    paragraph and of its hyperlinks, with tabs, line breaks and non-breaking hyphens.
+    Args:
+        paragraph (xml.etree.ElementTree.Element): The w:p element.
+    Returns:
+        str: The text of the paragraph.
+    """
+    parts = []
+    for child in paragraph:
+        if child.tag == WORD_NAMESPACE + "r":
+            runs = (child,)
+        elif child.tag == WORD_NAMESPACE + "hyperlink":
+            runs = child.iterfind(WORD_NAMESPACE + "r")
+        else:
+            continue
+        for run in runs:
+            for item in run:
+                if item.tag == WORD_NAMESPACE + "t":
+                    parts.append(item.text or "")
+                elif item.tag == WORD_NAMESPACE + "br":
+                    # page and column breaks have no text
+                    if item.get(WORD_NAMESPACE + "type", "textWrapping") == "textWrapping":
+                        parts.append("\n")
+                else:
+                    parts.append(DOCX_RUN_TEXT.get(item.tag, ""))
+    return "".join(parts)
+
+
+def docx_table_cells(table):
+    """
+    Yields the text of each cell of a w:tbl element, row by row, as python-docx's cell.text reads it.
+    A cell merged across columns (gridSpan) is a single w:tc, so it comes out once, where python-docx's
+    row.cells repeats it for every column; the continuation cells of a cell merged across rows (vMerge)
+    are skipped, as their text belongs to the cell above. Nested tables are not part of a cell's text.
+    Args:
+        table (xml.etree.ElementTree.Element): The w:tbl element.
+    Yields:
+        str: The text of each cell, its paragraphs joined with newlines.
+    """
+    for row in table.iterfind(WORD_NAMESPACE + "tr"):
+        for cell in row.iterfind(WORD_NAMESPACE + "tc"):
+            merge = cell.find(WORD_NAMESPACE + "tcPr/" + WORD_NAMESPACE + "vMerge")
+            if merge is not None and merge.get(WORD_NAMESPACE + "val", "continue") == "continue":
+                continue
+            yield "\n".join(docx_paragraph_text(paragraph) for paragraph in cell.iterfind(WORD_NAMESPACE + "p"))
+
+
+def iter_docx_tables(data):
+    """
+    Streams the top-level tables of a DOCX file, the ones python-docx lists in Document.tables.
+    word/document.xml is read straight out of the zip with an incremental XML parser; each table is
+    turned into text as soon as it is parsed, then dropped with everything else before it, so the
+    whole document is never held in memory and no python-docx objects are built.
+    Args:
+        data (bytes): The content of the DOCX file.
+    Yields:
+        str: The text of each table, one merged cell per line, as docx_table_cells() reads them.
+    """
+    import zipfile
+    from xml.etree.ElementTree import iterparse
+
+    with zipfile.ZipFile(BytesIO(data)) as archive, archive.open("word/document.xml") as document:
+        depth = 0
+        for event, element in iterparse(document, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            # w:document is at depth 1 and w:body at depth 2, so their children end at depth 2
+            if depth == 2:
+                if element.tag == WORD_NAMESPACE + "tbl":
+                    yield "".join(text + "\n" for text in docx_table_cells(element))
+                element.clear()
+
+
+def iter_document_text(url, data):
+    """
+    Extracts text content from the downloaded bytes of a PDF or DOCX file, one piece at a time.
+    Pages of a PDF are only extracted when the next piece is asked for, so the caller can work on
+    the first pages while the rest are still undecoded. With DPS_PDF_LAYOUT set, a PDF page laid out
+    as a calendar grid is read cell by cell with layout_day_cells(), each day's date line followed by
+    its menu; other pages, and every page with DPS_PDF_LAYOUT=0, are read as flat text.
+
+    Args:
+        url (str): The URL the file was downloaded from, used to pick the file type.
+        data (bytes): The content of the file, as returned by fetch_document().
+
+    Yields:
+        str: The text of each PDF page, or of each DOCX table, every line ending with a newline.
+    """
+    if url.endswith(".pdf"):
+        from pypdf import PdfReader
+
+        with metrics.span("extract"):
+            reader = PdfReader(BytesIO(data))
+            pages = reader.pages
+        for page in pages:
+            with metrics.span("extract"):
+                if PDF_LAYOUT:
+                    (text, fragments) = page_fragments(page)
+                    cells = layout_day_cells(fragments)
+                else:
+                    (text, cells) = (page.extract_text(), None)
+                if cells:
+                    text = "".join(line + "\n" for lines in cells for line in lines)
+                    metrics.count("pages_layout", document=document_name(url))
+                else:
+                    text += "\n"
+            metrics.count("pages_extracted", document=document_name(url))
+            yield text
+    elif url.endswith(".docx"):
+        tables = iter_docx_tables(data)
+        while True:
+            with metrics.span("extract"):
+                text = next(tables, None)
+            if text is None:
+                break
+            metrics.count("pages_extracted", document=document_name(url))
+            yield text
+
+
+def document_to_text(url, data):
+    """
+    Extracts text content from the downloaded bytes of a PDF or DOCX file.
+
+    Args:
+        url (str): The URL the file was downloaded from, used to pick the file type.
+        data (bytes): The content of the file, as returned by fetch_document().
+
+    Returns:
+        str: The extracted text content from the file. Returns None if the URL does not end with ".pdf" or ".docx".
+    """
+    if not (url.endswith(".pdf") or url.endswith(".docx")):
+        return None
+    return "".join(iter_document_text(url, data))
+
+
+def iter_url_text(url):
+    """
+    Downloads a PDF or DOCX file and yields its text page by page, or table by table.
+
+    Args:
+        url (str): The URL of the file to extract text from. The URL should end with either ".pdf" or ".docx".
+
+    Yields:
+        str: The text of each page or table. Nothing is yielded if the URL does not end with ".pdf" or ".docx".
+    """
+    data = fetch_document(url)
+    if data is not None:
+        yield from iter_document_text(url, data)
+
+
 def url_to_text(url):
     """
     Extracts text content from a given URL pointing to a PDF or DOCX file.
@@ -128,25 +1215,10 @@ def url_to_text(url):
     Returns:
         str: The extracted text content from the file. Returns None if the URL does not end with ".pdf" or ".docx".
     """
-    if url.endswith(".pdf"):
-        remote_file = urlopen(url).read()
-        memory_file = BytesIO(remote_file)
-        reader = PdfReader(memory_file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    elif url.endswith(".docx"):
-        response = requests.get(url)
-        doc = docx.Document(BytesIO(response.content))
-        text = ''
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    text += cell.text + '\n'
-        return text
-    else:
+    data = fetch_document(url)
+    if data is None:
         return None
+    return document_to_text(url, data)
 
 
 def is_valid_date(date_string, language):
@@ -164,70 +1236,312 @@ def is_valid_date(date_string, language):
     return parse_date_string(date_string, language) is not None
 
 
-def parse_date_string(date_string, language):
+def parse_date_string(date_string, language, year=None):
     """
     Parses a date string into year, month, and day.
+    Menus do not print the year, so it is only a placeholder here; text_to_events() works out the
+    real year of each date with resolve_menu_dates().
     Args:
         date_string (str): The date string to parse. It should be in the format "Month Day" 
                            where "Month" is the full name of the month and "Day" is the day of the month.
                            Example: "January 15" or "Enero 15".
         language (str): The language of the date string. Supported values are "es" for Spanish and "en" for English.
+        year (int): The year to return. Defaults to the current year.
     Returns:
         tuple: A tuple containing the year (int), month (int), and day (int) if the date string is successfully parsed.
                Returns None if the date string does not match the expected format or if the language is not supported.
     Raises:
         None
     """
-    if language == "es":
-        pattern = r"^(Enero|Febrero|Marzo|Abril|Mayo|Junio|Julio|Agosto|Septiembre|Octubre|Noviembre|Diciembre)\s+(\d{1,2})$"
-    else:
-        pattern = r"^(January|February|March|April|May|June|July|August|September|October|November|December)\s+(\d{1,2})$"
-    match = re.match(pattern, date_string)
+    pattern = DATE_PATTERNS.get(language)
+    if pattern is None:
+        return None
+    match = pattern.match(date_string)
     if not match:
         return None
-    month_name = match.group(1)
+    month = MONTH_NUMBERS[language][match.group(1)]
     day = int(match.group(2))
+    if year is None:
+        year = datetime.now().year
+    return year, month, day
 
-    year = datetime.now().year
-    if language == "es":
-        # list of month names
-        month_names = [
-            "Enero",
-            "Febrero",
-            "Marzo",
-            "Abril",
-            "Mayo",
-            "Junio",
-            "Julio",
-            "Agosto",
-            "Septiembre",
-            "Octubre",
-            "Noviembre",
-            "Diciembre",
-        ]
-        month = month_names.index(month_name) + 1
-    elif language == "en":
-        month_names = [
-            "January",
-            "February",
-            "March",
-            "April",
-            "May",
-            "June",
-            "July",
-            "August",
-            "September",
-            "October",
-            "November",
-            "December",
-        ]
-        month = month_names.index(month_name) + 1
+
+def iter_lines(chunks):
+    """
+    Splits streamed text into lines, with the same result as "".join(chunks).split("\n").
+    A line cut between two chunks is put back together before it is yielded.
+    Args:
+        chunks (iterable): The pieces of the text, e.g. from iter_document_text().
+    Yields:
+        str: Each line, without its newline.
+    """
+    pending = []
+    for chunk in chunks:
+        parts = chunk.split("\n")
+        pending.append(parts[0])
+        if len(parts) > 1:
+            yield "".join(pending)
+            yield from parts[1:-1]
+            pending = [parts[-1]]
+    yield "".join(pending)
+
+
+def iter_menu_days(lines, day_language):
+    """
+    Splits the lines of a menu into days in a single pass.
+    A day starts at a line holding a date ("May 4") and takes every following line as its description,
+    up to the next date or to a line with one of the STOP_WORDS. Lines after a stop word are skipped
+    until the next date.
+    Args:
+        lines (iterable): The lines of the extracted menu text. Any iterable works, including a generator.
+        day_language (str): The language used for parsing dates.
+    Yields:
+        tuple: The (year, month, day) of the date and the list of stripped description lines.
+    """
+    date_parts = None
+    description = []
+    in_description = False
+    for line in lines:
+        stripped = line.strip()
+        next_date = parse_date_string(stripped, day_language)
+        if next_date is not None:
+            if date_parts is not None:
+                yield date_parts, description
+            date_parts = next_date
+            description = []
+            in_description = True
+        elif in_description:
+            if any(word in line for word in STOP_WORDS):
+                in_description = False
+            else:
+                description.append(stripped)
+    if date_parts is not None:
+        yield date_parts, description
+
+
+def resolve_menu_dates(month_days, date_hint=None, today=None):
+    """
+    Picks the year of each date of a menu, which only prints the month and day.
+    The dates are taken in the order of the menu, and a month more than six months before the previous
+    one starts the next year, as on a menu running from December into January. Each candidate year of
+    the first date, up to two years either side of date_hint, is scored by how many dates would fall on
+    a weekend, since menus only cover school days, and then by how far the menu would be from
+    date_hint; the best one wins. Over a dozen school days, only one year in six or so fits the days of
+    the week, so this also holds when the hint is off by a year or two, or missing.
+    Args:
+        month_days (list): The (month, day) of each date, in the order of the menu.
+        date_hint (tuple): The (year, month) the menu is for, from document_date_hint(), or None.
+        today (datetime.date): The date to use when there is no hint. Defaults to today.
+    Returns:
+        list: The datetime.date of each date, or None for a date that does not exist in its year.
+    """
+    if not month_days:
+        return []
+    if date_hint is None:
+        today = today or date.today()
+        # without a hint, look further back, for reprocessing old menus
+        (hint_year, hint_month) = (today.year, today.month)
+        candidates = range(hint_year - 3, hint_year + 2)
     else:
-        return None
-    return year, month, day
+        (hint_year, hint_month) = date_hint
+        candidates = range(hint_year - 2, hint_year + 3)
+    # years after the first date's year, for menus running into the next year
+    offsets = []
+    offset = 0
+    previous = month_days[0][0]
+    for month, _ in month_days:
+        if month < previous - 6:
+            offset += 1
+        offsets.append(offset)
+        previous = month
+
+    def resolve(year):
+        dates = []
+        for (month, day), offset in zip(month_days, offsets):
+            try:
+                dates.append(date(year + offset, month, day))
+            except ValueError:
+                dates.append(None)
+        return dates
+
+    def score(year):
+        dates = resolve(year)
+        invalid = sum(1 for day in dates if day is None)
+        weekends = sum(1 for day in dates if day is not None and day.weekday() >= 5)
+        distance = min(abs((day.year * 12 + day.month) - (hint_year * 12 + hint_month))
+                       for day in dates if day is not None) if invalid < len(dates) else 0
+        return (invalid + weekends, distance)
+
+    return resolve(min(candidates, key=score))
+
+
+class EmojiAnnotator:
+    """
+    Adds emojis to menu lines, remembering the results.
+
+    The word to emoji lookup table for each language is built once from the emoji name data,
+    instead of emoji.emojize() scanning every emoji for every unseen name. Lemmas and whole
+    annotated lines are cached, since the same dishes repeat on almost every menu; the line
+    cache keeps the most recently used max_lines entries. stats counts hits and misses of both.
+    lemma_table seeds the lemma cache, so words in it never need WordNet.
+    """
+
+    # emoji.emojize() language argument for each menu language
+    EMOJI_LANGUAGES = {"es": "es", "en": "alias"}
+
+    def __init__(self, max_lines=10000, lemma_table=None):
+        self.max_lines = max_lines
+        self.stats = {"line_hits": 0, "line_misses": 0, "lemma_hits": 0, "lemma_misses": 0}
+        self._tables = {}
+        self._lemmas = dict(lemma_table or {})
+        self._lines = OrderedDict()
+
+    def table(self, language):
+        """
+        Returns the lookup table from emoji name (without colons) to emoji for a language.
+        It resolves names the way emoji.emojize() does: only fully-qualified emojis count, and for
+        English an alias wins over a name, otherwise the first emoji with the name wins.
+        Args:
+            language (str): The language code ('es' for Spanish, 'en' for English).
+        Returns:
+            dict: The lookup table.
+        """
+        if language not in self._tables:
+            import emoji
+
+            emoji_language = self.EMOJI_LANGUAGES[language]
+            # make sure the names for this language are loaded into EMOJI_DATA
+            emoji.emojize("", language=emoji_language)
+            fully_qualified = emoji.STATUS["fully_qualified"]
+            fields = ["alias", "en"] if emoji_language == "alias" else [emoji_language]
+            table = {}
+            for field in fields:
+                names = {}
+                for emj, data in emoji.EMOJI_DATA.items():
+                    if data["status"] > fully_qualified:
+                        continue
+                    values = data.get(field, [])
+                    for name in values if isinstance(values, list) else [values]:
+                        names.setdefault(name.strip(":"), emj)
+                for name, emj in names.items():
+                    table.setdefault(name, emj)
+            self._tables[language] = table
+        return self._tables[language]
+
+    def lemmatize(self, word, wnl=None):
+        """
+        Returns the lemma of a word, from the cache when it has been seen before.
+        Args:
+            word (str): The lowercase word.
+            wnl (WordNetLemmatizer): The lemmatizer used on a cache miss. Defaults to the shared one from get_lemmatizer().
+        Returns:
+            str: The lemma.
+        """
+        lemma = self._lemmas.get(word)
+        if lemma is None:
+            self.stats["lemma_misses"] += 1
+            if any(c.isalpha() for c in word):
+                lemma = (wnl or get_lemmatizer()).lemmatize(word)
+            else:
+                # prices, dates and quantities have no letters for WordNet to strip
+                lemma = word
+            self._lemmas[word] = lemma
+        else:
+            self.stats["lemma_hits"] += 1
+        return lemma
+
+    def annotate(self, next_line, language, wnl=None):
+        """
+        Adds emojis to a line, with the same result as the emoji.emojize() based version of add_emojis().
+        Args:
+            next_line (str): The input string to which emojis will be added.
+            language (str): The language code ('es' for Spanish, 'en' for English).
+            wnl (WordNetLemmatizer): The lemmatizer used for words that are not cached yet. Defaults to the shared one.
+        Returns:
+            str: The input string with emojis added, or None if the language is not supported.
+        """
+        import emoji
+
+        if language not in self.EMOJI_LANGUAGES:
+            return None
+        key = (next_line, language)
+        if key in self._lines:
+            self.stats["line_hits"] += 1
+            self._lines.move_to_end(key)
+            return self._lines[key]
+        self.stats["line_misses"] += 1
+
+        next_line_no_colons: str = next_line.replace(":", "")
+        lemmatized_string = " ".join(
+            [self.lemmatize(word, wnl) for word in next_line_no_colons.lower().split()]
+        )
+        with_colons: str = re.sub(r"(\w*)", r":\1:", lemmatized_string)
+        table = self.table(language)
+
+        def replace(match):
+            name = unicodedata.normalize("NFKC", match.group(1)[1:-1])
+            return table.get(name, match.group(1))
+
+        with_emojis = EMOJI_NAME_PATTERN.sub(replace, with_colons)
+        only_emoji: str = "".join([c for c in with_emojis if c in emoji.EMOJI_DATA])
+        result = next_line_no_colons + only_emoji
 
+        self._lines[key] = result
+        if len(self._lines) > self.max_lines:
+            self._lines.popitem(last=False)
+        return result
 
-def add_emojis(next_line, language, wnl):
+    def hit_rate(self):
+        """
+        Returns:
+            float: The fraction of annotate() calls answered from the line cache.
+        """
+        calls = self.stats["line_hits"] + self.stats["line_misses"]
+        return self.stats["line_hits"] / calls if calls else 0.0
+
+
+def get_emoji_annotator():
+    """
+    Returns the emoji annotator shared by every menu parsed in this process.
+    Returns:
+        EmojiAnnotator: The shared annotator, created on first use.
+    """
+    global _emoji_annotator
+    if _emoji_annotator is None:
+        _emoji_annotator = EmojiAnnotator(lemma_table=load_lemma_table())
+    return _emoji_annotator
+
+
+def get_lemmatizer():
+    """
+    Returns the WordNet lemmatizer shared by this process.
+    nltk is imported and the lemmatizer created on first use; WordNet itself is loaded on the first lemmatize() call.
+    Returns:
+        WordNetLemmatizer: The shared lemmatizer.
+    """
+    global _lemmatizer
+    if _lemmatizer is None:
+        from nltk.stem import WordNetLemmatizer
+
+        _lemmatizer = WordNetLemmatizer()
+    return _lemmatizer
+
+
+def load_lemma_table(path=LEMMAS_JSON):
+    """
+    Loads the precomputed word to lemma table shipped next to this script.
+    Args:
+        path (str): The JSON file holding the table. Regenerate it with build_lemmas.py.
+    Returns:
+        dict: The table, or an empty dict if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def add_emojis(next_line, language, wnl=None):
     """
     Adds emojis to the given text based on the specified language.
 
@@ -235,106 +1549,128 @@ def add_emojis(next_line, language, wnl):
         next_line (str): The input string to which emojis will be added.
         language (str): The language code for emoji conversion ('es' for Spanish, 'en' for English).
         wnl (WordNetLemmatizer): An instance of WordNetLemmatizer for lemmatizing words in the input string.
+            Defaults to the shared lemmatizer, which is only loaded for words missing from the lemma table.
 
     Returns:
         str: The input string with emojis added, or None if the language is not supported.
     """
-    next_line_no_colons: str = re.sub(r":", r"", next_line)
-    next_line_no_colons_low = next_line_no_colons.lower()
-    lemmatized_string = " ".join(
-        [wnl.lemmatize(words) for words in next_line_no_colons_low.split()]
-    )
-    with_colons: str = re.sub(r"(\w*)", r":\1:", lemmatized_string)
-    if language == "es":
-        with_emojis: str = emoji.emojize(string=with_colons, language=language)
-    elif language == "en":
-        with_emojis: str = emoji.emojize(string=with_colons, language="alias")
-    else:
-        return None
-    only_emoji: str = "".join([c for c in with_emojis if c in emoji.EMOJI_DATA])
-    return next_line_no_colons + only_emoji
+    return get_emoji_annotator().annotate(next_line, language, wnl)
 
 
-def text_to_ics(text, event_title, language, day_language):
+def text_to_events(text, event_title, language, day_language, date_hint=None):
     """
-    Converts a given text into an ICS calendar format.
+    Converts a given text into menu events, one per day.
     Args:
-        text (str): The input text containing event details.
+        text (str or iterable): The input text containing event details, whole or as a stream of
+            pieces such as the pages from iter_document_text(). A stream is consumed as it is produced.
         event_title (str): The title of the event.
         language (str): The language used for processing text.
         day_language (str): The language used for parsing dates.
+        date_hint (tuple): The (year, month) the menu is for, from document_date_hint(), or None.
     Returns:
-        ics.Calendar: A calendar object containing the parsed events.
+        list: The MenuEvent objects, in the order of the menu. serialize_events() writes them as a calendar.
     Notes:
-        - The function splits the input text into lines and processes each line to identify valid dates.
-        - For each valid date, an event is created with the specified title and date.
-        - The description of the event is built from subsequent lines until another valid date or specific keywords are encountered.
-        - The event is marked as an all-day event and additional properties are set.
-    """
-    # Create WordNetLemmatizer object
-    wnl = WordNetLemmatizer()
-
-    calendar = ics.Calendar()
-    lines = text.split("\n")
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        if not is_valid_date(line.strip(), day_language):
-            i += 1
-            continue
-        date_parts = parse_date_string(line.strip(), day_language)
-        year, month, day = date_parts
-        event = ics.Event()
-        event.name = event_title
-        event.begin = datetime(year, month, day, tzinfo=timezone.utc)  # set begin time
-        event.make_all_day()
-        extra_content = ics.utils.ContentLine(name="TRANSP", value="TRANSPARENT")
-        event.extra.append(extra_content)
-        # build description until you reach next date
-        event.description = ""
-        while (
-            i + 1 < len(lines)
-            and not is_valid_date(lines[i + 1].strip(), day_language)
-            and "Prices" not in lines[i + 1]
-            and "Precios" not in lines[i + 1]
-            and "ambios" not in lines[i + 1]
-            and "change" not in lines[i + 1]
-        ):
-            next_line = lines[i + 1].strip()
-            line = add_emojis(next_line, language, wnl)
-            event.description += line + "\n"
-            i += 1
-        calendar.events.add(event)
-    return calendar
+        - The function splits the input text into days with iter_menu_days().
+        - The year of each day is worked out with resolve_menu_dates() once the whole menu is read.
+        - For each day, an all-day event is created with the specified title and date.
+        - The description of the event is built from the lines of the day, with emojis added.
+    """
+    days = []
+    lines = text.split("\n") if isinstance(text, str) else iter_lines(text)
+    for (_, month, day), description in iter_menu_days(lines, day_language):
+        # description is every line up to the next date
+        with metrics.span("add_emojis"):
+            description = "".join(add_emojis(line, language) + "\n" for line in description)
+        days.append(((month, day), description))
+    dates = resolve_menu_dates([month_day for month_day, _ in days], date_hint)
+    return [MenuEvent(event_title, day, description)
+            for day, (_, description) in zip(dates, days) if day is not None]
+
+
+def get_ics_manifest():
+    """
+    Returns the digest manifest of the ICS files shared by this module, or None if it is disabled.
+    Set DPS_ICS_MANIFEST to an empty string to disable it.
+    Returns:
+        DigestManifest: The shared manifest, created on first use.
+    """
+    global _ics_manifest
+    if _ics_manifest is None and ICS_MANIFEST_JSON:
+        _ics_manifest = DigestManifest(ICS_MANIFEST_JSON)
+    return _ics_manifest
+
+
+def get_calendar_archive():
+    """
+    Returns the month archive of the calendars shared by this module, or None if it is disabled.
+    Set DPS_ARCHIVE_DIR to an empty string to disable it.
+    Returns:
+        CalendarArchive: The shared archive, created on first use.
+    """
+    global _calendar_archive
+    if _calendar_archive is None and ARCHIVE_DIR:
+        _calendar_archive = CalendarArchive(ARCHIVE_DIR, ARCHIVE_MONTHS + 1)
+    return _calendar_archive
+
+
+def archive_ics(ics_string, filename):
+    """
+    Merges the events of an ICS file into the month archive of its calendar, so menus of past
+    months stay published after the file itself has moved on to the next menu.
+    Args:
+        ics_string (str): The ICS string content.
+        filename (str): The name of the ICS file, which names the calendar.
+    Returns:
+        list: The months (YYYY-MM) whose archive segment was rewritten.
+    """
+    archive = get_calendar_archive()
+    if archive is None or not ics_string:
+        return []
+    with metrics.span("archive"):
+        written = archive.merge(filename, read_events(ics_string))
+    metrics.count("archive_months_written", len(written), calendar=filename)
+    return written
 
 
 def to_file(ics_string, filename):
     """
     Save the given ICS string to a file with the specified filename.
+    Its digest is recorded in the ICS manifest. If the file already holds the same calendar, it is
+    not rewritten, so its modification time (and any HTTP cache validator built on it) stays the same.
+    Its events are merged into the month archive either way, see archive_ics().
 
     Args:
         ics_string (str): The ICS string content to be saved.
         filename (str): The name of the file where the ICS string will be saved.
 
     Returns:
-        None
+        bool: True if the file was written, False if it was unchanged or the string was empty.
     """
-    if ics_string:
-        with open(filename, "w", newline="", encoding="utf-8") as f:
-            f.write(ics_string)
+    if not ics_string:
+        return False
+    archive_ics(ics_string, filename)
+    digest = ics_digest(ics_string)
+    manifest = get_ics_manifest()
+    if manifest is not None and manifest.get(filename) == digest and os.path.exists(filename):
+        metrics.count("ics_unchanged", calendar=filename)
+        return False
+    with metrics.span("write"):
+        atomic_write_text(filename, ics_string, newline="")
+    if manifest is not None:
+        manifest.record(filename, digest)
+    metrics.count("ics_written", calendar=filename)
+    return True
 
 
-def generate_ics(filename, level, language, day_language, meal):
+def menu_target(level, language, meal):
     """
-    Generates an ICS (iCalendar) file from a PDF menu.
+    Looks up the event title and output filename for a menu.
     Args:
-        filename (str): The filename of the file to be converted.
         level (str): The school level (e.g., 'k12', 'elementary', 'middle', 'high', 'bic', 'prek').
         language (str): The language of the menu ('en' for English, 'es' for Spanish).
-        day_language (str): The language of the day names in the calendar.
         meal (str): The type of meal (e.g., 'breakfast', 'lunch', 'afterschoolsnack', 'snack').
     Returns:
-        bool: True if the ICS file was generated successfully, False otherwise.
+        tuple: The event title (str) and the ICS output filename (str), or None if the language is not supported.
     """
     meal_terms_en = {
         "breakfast": "Breakfast",
@@ -373,20 +1709,282 @@ def generate_ics(filename, level, language, day_language, meal):
         event_title = f"DPS - Menú {meal_terms_es[meal]} Escuela {level_terms_es[level]}"  # All events in the calendar will have this title
         outfile = f"spanish_{level}_{meal}.ics"
     else:
-        return False
+        return None
+    return event_title, outfile
+
+
+def clean_link(filename):
+    """
+    Turns a scraped filename into a downloadable link.
+    Args:
+        filename (str): The filename (URL) as found on the listing page.
+    Returns:
+        str: The URL with spaces escaped and the inline disposition removed.
+    """
     link = filename.replace(" ", "%20")
     link = link.replace("?disposition=inline", "")
+    return link
+
+
+def document_to_ics(link, data, event_title, language, day_language, outfile=None, date_hint=None):
+    """
+    Converts a downloaded menu document into a serialized ICS string.
+    This is the CPU-bound part of generate_ics(), kept at module level so it can run in a process pool.
+    Args:
+        link (str): The URL the document was downloaded from.
+        data (bytes): The content of the document.
+        event_title (str): The title of every event in the calendar.
+        language (str): The language of the menu ('en' for English, 'es' for Spanish).
+        day_language (str): The language of the day names in the calendar.
+        outfile (str): The ICS filename, which the UIDs are derived from when DPS_DETERMINISTIC_ICS is set.
+        date_hint (tuple): The (year, month) the menu is for, from document_date_hint().
+    Returns:
+        str: The serialized calendar.
+    """
+    annotator = get_emoji_annotator()
+    before = dict(annotator.stats)
+    with metrics.span("parse"):
+        events = text_to_events(iter_document_text(link, data), event_title, language, day_language, date_hint)
+    metrics.count("events_parsed", len(events), document=document_name(link))
+    # the annotator lives as long as its process; count what this document added to its hits and misses
+    for name, value in annotator.stats.items():
+        metrics.count("emoji_" + name, value - before[name], document=document_name(link))
+    with metrics.span("serialize"):
+        return serialize_events(events, calendar=outfile if DETERMINISTIC_ICS else None)
+
+
+def document_to_ics_with_metrics(link, data, event_title, language, day_language, outfile=None, date_hint=None):
+    """
+    Runs document_to_ics() in a worker process and sends its metrics back with the result.
+    Args:
+        link, data, event_title, language, day_language, outfile, date_hint: As for document_to_ics().
+    Returns:
+        tuple: The serialized calendar and the metrics snapshot of this job, to merge in the parent process.
+    """
+    metrics.get_metrics().reset()
+    ics_string = document_to_ics(link, data, event_title, language, day_language, outfile, date_hint)
+    return ics_string, metrics.get_metrics().snapshot()
+
+
+def generate_ics(filename, level, language, day_language, meal, date_hint=None):
+    """
+    Generates an ICS (iCalendar) file from a PDF menu.
+    Args:
+        filename (str): The filename of the file to be converted.
+        level (str): The school level (e.g., 'k12', 'elementary', 'middle', 'high', 'bic', 'prek').
+        language (str): The language of the menu ('en' for English, 'es' for Spanish).
+        day_language (str): The language of the day names in the calendar.
+        meal (str): The type of meal (e.g., 'breakfast', 'lunch', 'afterschoolsnack', 'snack').
+        date_hint (tuple): The (year, month) the menu is for, from its job. Without one, the filename is
+            the only hint, see document_date_hint().
+    Returns:
+        bool: True if the ICS file was generated successfully, False otherwise.
+    """
+    target = menu_target(level, language, meal)
+    if not target:
+        return False
+    (event_title, outfile) = target
+    link = clean_link(filename)
     # print(link)
-    text = url_to_text(link)
-    # print(text)
-    cal = text_to_ics(text, event_title, language, day_language)
-    ics_string = cal.serialize()
+    with metrics.span("parse"):
+        events = text_to_events(iter_url_text(link), event_title, language, day_language,
+                                date_hint or document_date_hint(filename))
+    metrics.count("events_parsed", len(events), document=document_name(link))
+    with metrics.span("serialize"):
+        ics_string = serialize_events(events, calendar=outfile if DETERMINISTIC_ICS else None)
     # print(ics_string)
     to_file(ics_string, outfile)
     print(outfile)
     return True
 
 
+def generate_all_ics(jobs, max_workers=MAX_WORKERS, store=None):
+    """
+    Generates ICS files for a batch of menus concurrently.
+    Downloads run in a thread pool and text extraction plus event building run in a process pool,
+    at most max_workers of each at a time. Worker processes are spawned rather than forked, since
+    forking while the download threads are running can deadlock. At most 2 * max_workers documents are
+    downloaded or being parsed at once, and only their digest is kept once parsed, so memory does not
+    grow with the batch. Files are written in the order of jobs, as soon as every earlier job is done, so
+    when two documents map to the same calendar the later one wins, exactly as with serial generate_ics() calls.
+    A document that fails to download or parse is reported, recorded as failed and skipped; the rest of
+    the batch goes on.
+    Args:
+        jobs (list): A list of (filename, level, language, day_language, meal, date_hint) tuples, as passed to
+            generate_ics(), e.g. from find_jobs().
+        max_workers (int): The concurrency limit. 1 or less processes the jobs serially.
+        store (LinkStore): If given, each document is recorded in it as soon as its ICS file is written,
+            or as failed once its download or parse fails.
+    Returns:
+        list: A list of bools, one per job, True if the ICS file was generated successfully.
+    """
+    targets = [menu_target(level, language, meal) for (_, level, language, _, meal, _) in jobs]
+    results = []
+
+    def fail(index, stage, error):
+        filename = jobs[index][0]
+        print(f"Failed {filename}: {stage}: {error}")
+        metrics.count("documents_failed", document=document_name(clean_link(filename)), stage=stage)
+        if store is not None:
+            store.record(filename, outfile=targets[index][1], status="failed", date_hint=jobs[index][5])
+        results.append(False)
+
+    def finish(index, digest, ics_string):
+        (event_title, outfile) = targets[index]
+        to_file(ics_string, outfile)
+        print(outfile)
+        if store is not None:
+            store.record(jobs[index][0], sha256=digest, outfile=outfile, status="ok", date_hint=jobs[index][5])
+        results.append(True)
+
+    if max_workers <= 1 or len(jobs) <= 1:
+        for index, (filename, level, language, day_language, meal, date_hint) in enumerate(jobs):
+            if not targets[index]:
+                results.append(False)
+                continue
+            link = clean_link(filename)
+            (event_title, outfile) = targets[index]
+            stage = "fetch"
+            try:
+                data = fetch_document(link)
+                stage = "parse"
+                ics_string = document_to_ics(link, data, event_title, language, day_language, outfile, date_hint)
+            except Exception as e:
+                fail(index, stage, e)
+                continue
+            finish(index, hashlib.sha256(data).hexdigest(), ics_string)
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_workers) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as parse_pool:
+        waiting = iter([index for index, target in enumerate(targets) if target])
+        # (stage, job index, digest of the document once downloaded) of each running download or parse
+        pending = {}
+        # (None, ics_string, digest), or (failed stage, error, None), of each finished job not written yet
+        outcomes = {}
+
+        def start_next():
+            index = next(waiting, None)
+            if index is not None:
+                pending[fetch_pool.submit(fetch_document, clean_link(jobs[index][0]))] = ("fetch", index, None)
+
+        for _ in range(2 * max_workers):
+            start_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                (stage, index, digest) = pending.pop(future)
+                (filename, level, language, day_language, meal, date_hint) = jobs[index]
+                (event_title, outfile) = targets[index]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    outcomes[index] = (stage, e, None)
+                    start_next()
+                    continue
+                if stage == "fetch":
+                    # start parsing each document as soon as its download finishes
+                    parse = parse_pool.submit(document_to_ics_with_metrics, clean_link(filename), result, event_title,
+                                              language, day_language, outfile, date_hint)
+                    pending[parse] = ("parse", index, hashlib.sha256(result).hexdigest())
+                    continue
+                (ics_string, snapshot) = result
+                metrics.get_metrics().merge(snapshot)
+                outcomes[index] = (None, ics_string, digest)
+                start_next()
+            # write in job order so the output does not depend on which worker finished first
+            while len(results) < len(jobs) and (not targets[len(results)] or len(results) in outcomes):
+                index = len(results)
+                if not targets[index]:
+                    results.append(False)
+                    continue
+                (failed_stage, value, digest) = outcomes.pop(index)
+                if failed_stage:
+                    fail(index, failed_stage, value)
+                else:
+                    finish(index, digest, value)
+    return results
+
+
+def document_name(link):
+    """
+    Returns the filename part of a document URL, e.g. DPS_K12_Lunch_Apr25.pdf, used to label its metrics.
+    Args:
+        link (str): The URL of the document.
+    Returns:
+        str: The last path segment of the URL.
+    """
+    return link.split("?")[0].rsplit("/", 1)[-1]
+
+
+Classification = namedtuple("Classification", ["level", "language", "meal", "confidence", "reason"])
+
+
+def compile_filename_rules():
+    """
+    Compiles the tokens of every filename rule into one regular expression.
+    With no token a prefix of another, at most one token can start at a given position, so
+    searching again one character after the start of each match finds every token, overlapping or not.
+    Raises:
+        ValueError: If a token is a prefix of another one, which the alternation could hide.
+    Returns:
+        re.Pattern: The pattern, matching any one token.
+    """
+    tokens = set(FILENAME_EXCLUDE_TOKENS) | {FILENAME_SPANISH_TOKEN}
+    tokens |= {token for token, _ in FILENAME_LEVEL_RULES} | {token for token, _, _ in FILENAME_MEAL_RULES}
+    for token in tokens:
+        for other in tokens:
+            if other != token and other.startswith(token):
+                raise ValueError(f"filename token {token!r} is a prefix of {other!r}")
+    return re.compile("|".join(re.escape(token) for token in sorted(tokens)))
+
+
+FILENAME_TOKEN_PATTERN = compile_filename_rules()
+
+
+@lru_cache(maxsize=4096)
+def classify_filename(filename):
+    """
+    Classifies a filename with the FILENAME_* rule tables, finding every rule token with one compiled regex.
+    Results are memoized, since the same links come back on every run.
+    Args:
+        filename (str): The name of the file to be classified.
+    Returns:
+        Classification: level, language and meal as described for parse_filename(), or None for level
+        and meal when the file is not a menu; confidence, 1.0 when the level and meal were both named,
+        0.5 when the level was only inferred from the meal, 0.0 when rejected; and a reason naming the
+        tokens that decided it.
+    """
+    found = set()
+    match = FILENAME_TOKEN_PATTERN.search(filename)
+    while match is not None:
+        found.add(match.group())
+        match = FILENAME_TOKEN_PATTERN.search(filename, match.start() + 1)
+    excluded = [token for token in FILENAME_EXCLUDE_TOKENS if token in found]
+    if excluded:
+        return Classification(None, None, None, 0.0, f"excluded by {excluded[0]!r}")
+
+    language = "es" if FILENAME_SPANISH_TOKEN in found else "en"
+    level_token, level = next(((token, level) for token, level in FILENAME_LEVEL_RULES if token in found), (None, None))
+    if level is None:
+        return Classification(None, language, None, 0.0, "no level token")
+    rule = next((rule for rule in FILENAME_MEAL_RULES if rule[0] in found), None)
+    if rule is None:
+        return Classification(level, language, None, 0.0, f"level {level_token!r}, no meal token")
+    (meal_token, meal, meal_language) = rule
+    if meal_language is not None:
+        language = meal_language
+    if FILENAME_SPANISH_TOKEN in found:
+        language = "es"
+
+    confidence = 0.5 if level_token in FILENAME_GENERIC_LEVEL_TOKENS else 1.0
+    reason = f"level {level_token!r}, meal {meal_token!r}"
+    if language == "es":
+        language_token = FILENAME_SPANISH_TOKEN if FILENAME_SPANISH_TOKEN in found else meal_token
+        reason += f", language {language_token!r}"
+    return Classification(level, language, meal, confidence, reason)
+
+
 def parse_filename(filename):
     """
     Parses the given filename to extract information about the level, language, and meal type.
@@ -409,168 +2007,44 @@ def parse_filename(filename):
                 - "snack"
     Returns False if the filename does not contain the required information or contains "Carb" or "Achievement".
     """
-    if "Carb" in filename:
-        return False
-    if "Achievement" in filename:
-        return False
-
-    if "Spanish" in filename:
-        language = "es"
-    else:
-        language = "en"
-    
-    if "K12" in filename:
-        level = "k12"
-    elif "K-12" in filename:
-        level = "k12"
-    elif "ES" in filename:
-        level = "elementary"
-    elif "Elementary" in filename:
-        level = "elementary"
-    elif "Primaria" in filename:
-        level = "elementary"
-    elif "MS" in filename:
-        level = "middle"
-    elif "Intermedia" in filename:
-        level = "middle"
-    elif "Middle" in filename:
-        level = "middle"
-    elif "HS" in filename:
-        level = "high"
-    elif "Secundaria" in filename:
-        level = "high"
-    elif "High" in filename:
-        level = "high"
-    elif "BIC" in filename:
-        level = "bic"
-    elif "Aula" in filename:
-        level = "bic"
-    elif "Classroom" in filename:
-        level = "bic"
-    elif "After" in filename:
-        level = "k12"
-    elif "Aula" in filename:
-        level = "bic"
-    elif "PreK" in filename:
-        level = "prek"
-    elif "Pre-K" in filename:
-        level = "prek"
-    elif "Prek" in filename:
-        level = "prek"
-    elif "Breakfast" in filename:
-        level = "k12"
-    else:
+    result = classify_filename(filename)
+    if result.meal is None:
         return False
-
-    if "Breakfast" in filename:
-        meal = "breakfast"
-    elif "Desayuno" in filename:
-        meal = "breakfast"
-        language = "es"
-    elif "Lunch" in filename:
-        meal = "lunch"
-    elif "Almuerzo" in filename:
-        meal = "lunch"
-        language = "es"
-    elif "Escuela-Primaria" in filename:
-        meal = "lunch"
-        language = "es"
-    elif "ASSP" in filename:
-        meal = "afterschoolsnack"
-        language = "en"
-    elif "After" in filename:
-        meal = "afterschoolsnack"
-    elif "Despu" in filename:
-        meal = "afterschoolsnack"
-        language = "es"
-    elif "Snack" in filename:
-        meal = "snack"
-    elif "Merienda" in filename:
-        meal = "snack"
-        language = "es"
-    else:
-        return False
-
-    if "Spanish" in filename:
-        language = "es"
-
-    return (level, language, meal)
+    return (result.level, result.language, result.meal)
 
 
 if __name__ == "__main__":
-    # Spanish menus
-    url = "https://www.dpsnc.net/documents/departments/school-nutrition-services/menus/men%C3%BAs-2025-2026---spanish/may-2026/26949709"
-    links = get_all_links(url)
-
     # load the old links to avoid processing the same link twice
-    with open("old_links.json", "r") as f:
-        old_links = json.load(f)
+    store = LinkStore()
+    store.import_json()
 
-    new_links = [link for link in links if link not in old_links]
+    jobs, new_links = discover_jobs(load_sources(), store)
     # do not process the same link twice
     if new_links:
-        docs = get_all_docs(url, new_links)
-        for filename in docs:
-            params = parse_filename(filename)
-            if params:
-                print(filename)
-                (level, language, meal) = params
-                generate_ics(filename, level, language, language, meal)
-
         # This code was to fix a menu with a mix of languages
         # Most content was in Spanish, but the days were labeled in English
         '''
-        doc_filename = docs[1]
+        doc_filename = jobs[1][0]
         print(doc_filename)
         (level, language, meal) = parse_filename(doc_filename)
         print(level, language, meal)
         generate_ics(doc_filename, level, language, 'en', meal)
         '''
 
-        pdfs = get_all_pdfs(url, new_links)
-        for filename in pdfs:
-            params = parse_filename(filename)
-            if params:
-                print(filename)
-                (level, language, meal) = params
-                generate_ics(filename, level, language, language, meal)
-
-        old_links.extend(new_links)
-        with open("old_links.json", "w") as f:
-            json.dump(old_links, f)
+        generate_all_ics(jobs, store=store)
+
+        store.record_new(new_links, status="skipped")
+        store.export_json()
     else:
         print('No new links to process')
 
-    # English menus
-    url = "https://www.dpsnc.net/documents/departments/school-nutrition-services/menus/2025-2026-menus---english/may-2026/26949788"
-
-    links = get_all_links(url)
+    # months age out of the rolling files even in a run without new menus
+    archive = get_calendar_archive()
+    if archive is not None:
+        for calendar in archive.refresh_all():
+            metrics.count("archive_rolling_refreshed", calendar=calendar)
 
-    # load the old links to avoid processing the same link twice
-    with open("old_links.json", "r") as f:
-        old_links = json.load(f)
-
-    new_links = [link for link in links if link not in old_links]
-    # do not process the same link twice
-    if new_links:
-        docs = get_all_docs(url, new_links)
-        for filename in docs:
-            params = parse_filename(filename)
-            if params:
-                print(filename)
-                (level, language, meal) = params
-                generate_ics(filename, level, language, language, meal)
-
-        pdfs = get_all_pdfs(url, new_links)
-        for filename in pdfs:
-            params = parse_filename(filename)
-            if params:
-                print(filename)
-                (level, language, meal) = params
-                generate_ics(filename, level, language, language, meal)
-
-        old_links.extend(new_links)
-        with open("old_links.json", "w") as f:
-            json.dump(old_links, f)
-    else:
-        print('No new links to process')
+    cache = get_document_cache()
+    if cache:
+        print(f"Document cache: {cache.stats}")
+    metrics.write_report(REPORT_JSON, REPORT_PROMETHEUS)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+'''
+This script runs pdf_2_ics.py and gcal.py as one asyncio pipeline: each menu is downloaded, parsed,
+written to its ICS file and handed straight to its Google Calendar sync, so the uploads of the first
+menus overlap with the downloads and parsing of the rest, instead of waiting for the whole batch.
+Downloads run in threads through the shared pooled session, text extraction and event building run
+in a process pool, and the Google Calendar syncs run in threads with their own service objects.
+A bounded queue sits between parsing and uploading: when uploads fall behind, parsed menus wait in
+it and no new downloads start, so at most DPS_QUEUE_SIZE + DPS_MAX_WORKERS documents are in memory.
+Functions:
+    sync_file(menu_ids, filename, content):
+        Syncs one ICS file into its calendar, from a worker thread.
+    run_pipeline(jobs, menu_ids, store, max_workers, sync_workers, queue_size):
+        Generates and uploads a batch of menus, overlapping the two.
+Usage:
+- Set up 'credentials.json' and 'menu_ids.json' as for gcal.py.
+- Run the script instead of running pdf_2_ics.py and then gcal.py.
+'''
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import gcal
+import metrics
+import pdf_2_ics
+
+# Parsed menus waiting for their upload before parsing pauses
+QUEUE_SIZE = int(os.environ.get("DPS_QUEUE_SIZE", "4"))
+
+
+def sync_file(menu_ids, filename, content):
+    """
+    Syncs the events of one ICS file into its calendar, with the service object of the calling thread.
+    Args:
+        menu_ids (dict): A dictionary mapping filenames to Google Calendar IDs.
+        filename (str): The name of the ICS file.
+        content (str): The content of the ICS file.
+    """
+    print(filename)
+    with metrics.span("sync_file"):
+        gcal.process_content(menu_ids, gcal.get_thread_service(), filename, content)
+
+
+async def run_pipeline(jobs, menu_ids, store=None, max_workers=pdf_2_ics.MAX_WORKERS,
+                       sync_workers=gcal.MAX_WORKERS, queue_size=QUEUE_SIZE):
+    """
+    Generates the ICS files of a batch of menus and uploads each one as soon as it is written.
+    ICS files are written, and calendars synced, in the order of jobs when two menus map to the
+    same file, as generate_all_ics() does. Each calendar is synced by one task at a time. A menu that
+    fails to download or parse is reported and recorded as failed, and the others go on.
+    Args:
+        jobs (list): A list of (filename, level, language, day_language, meal, date_hint) tuples, as passed to
+            generate_ics(), e.g. from pdf_2_ics.discover_jobs().
+        menu_ids (dict): A dictionary mapping ICS filenames to Google Calendar IDs. Files without an ID are only written.
+        store (LinkStore): If given, each document is recorded in it as soon as its ICS file is written,
+            or as failed once its download or parse fails.
+        max_workers (int): The number of documents downloaded and parsed at the same time.
+        sync_workers (int): The number of calendars synced at the same time.
+        queue_size (int): The number of parsed menus that may wait for their upload.
+    Returns:
+        list: A list of bools, one per job, True if the ICS file was generated successfully.
+    Raises:
+        Exception: The first error of a calendar sync, once every menu has been handled.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    # a document holds its slot from the start of its download until its upload is queued
+    slots = asyncio.Semaphore(max(max_workers, 1))
+    calendar_locks = {}
+    errors = []
+
+    async def publish():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            (filename, content) = item
+            lock = calendar_locks.setdefault(menu_ids[filename], asyncio.Lock())
+            async with lock:
+                try:
+                    await asyncio.to_thread(sync_file, menu_ids, filename, content)
+                except Exception as e:
+                    # keep draining the queue, so the menus still being parsed do not wait forever
+                    print(f"Sync of {filename} failed: {e}")
+                    errors.append(e)
+
+    with ProcessPoolExecutor(max_workers=max(max_workers, 1), mp_context=multiprocessing.get_context("spawn")) as parse_pool:
+
+        async def build(job, target, previous):
+            (filename, level, language, day_language, meal, date_hint) = job
+            (event_title, outfile) = target
+            link = pdf_2_ics.clean_link(filename)
+            async with slots:
+                stage = "fetch"
+                try:
+                    data = await asyncio.to_thread(pdf_2_ics.fetch_document, link)
+                    stage = "parse"
+                    (ics_string, snapshot) = await loop.run_in_executor(
+                        parse_pool, pdf_2_ics.document_to_ics_with_metrics, link, data, event_title, language,
+                        day_language, outfile, date_hint
+                    )
+                except Exception as e:
+                    print(f"Failed {filename}: {stage}: {e}")
+                    metrics.count("documents_failed", document=pdf_2_ics.document_name(link), stage=stage)
+                    if store is not None:
+                        store.record(filename, outfile=outfile, status="failed", date_hint=date_hint)
+                    return False
+                metrics.get_metrics().merge(snapshot)
+                # an earlier menu for the same file goes first, so the later one wins
+                if previous is not None:
+                    await previous
+                pdf_2_ics.to_file(ics_string, outfile)
+                print(outfile)
+                if store is not None:
+                    store.record(filename, sha256=hashlib.sha256(data).hexdigest(), outfile=outfile, status="ok",
+                                 date_hint=date_hint)
+                if menu_ids.get(outfile):
+                    await queue.put((outfile, ics_string))
+            return True
+
+        publishers = [asyncio.create_task(publish()) for _ in range(max(sync_workers, 1))]
+        builds = []
+        last_build = {}
+        for job in jobs:
+            (filename, level, language, day_language, meal, date_hint) = job
+            target = pdf_2_ics.menu_target(level, language, meal)
+            if not target:
+                builds.append(None)
+                continue
+            task = asyncio.create_task(build(job, target, last_build.get(target[1])))
+            last_build[target[1]] = task
+            builds.append(task)
+        try:
+            results = [False if task is None else await task for task in builds]
+        finally:
+            for _ in publishers:
+                await queue.put(None)
+            await asyncio.gather(*publishers)
+    if errors:
+        raise errors[0]
+    return results
+
+
+if __name__ == "__main__":
+    (menu_ids, service) = gcal.load_resources()
+    store = pdf_2_ics.LinkStore()
+    store.import_json()
+
+    jobs, new_links = pdf_2_ics.discover_jobs(pdf_2_ics.load_sources(), store)
+    if jobs:
+        asyncio.run(run_pipeline(jobs, menu_ids, store=store))
+    if new_links:
+        store.record_new(new_links, status="skipped")
+        store.export_json()
+    else:
+        print('No new links to process')
+    metrics.write_report(pdf_2_ics.REPORT_JSON, pdf_2_ics.REPORT_PROMETHEUS)
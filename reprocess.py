@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+'''
+This script regenerates the ICS output of past menus in bulk, e.g. after a change to the parser.
+It takes every link recorded in .cache/links.db and old_links.json, or the ones whose level, meal, language
+or month (as parse_filename() and the date hint recorded with the link read them) match the filters given, downloads
+them through the document cache and parses them on every CPU core. The calendar of each document is
+written to its own file, reprocessed/<calendar>/<asset ID>_<name>.ics, so no menu overwrites another.
+Progress is checkpointed in reprocessed/checkpoint.json after every document, so an interrupted run
+resumes where it stopped, and a summary is written to reprocess_report.json at the end. With --archive,
+the calendars are then merged into the month archive of pdf_2_ics (docs/calendars), in link order.
+Functions:
+    select_jobs(links, levels, meals, languages, months, store):
+        Builds the jobs for the archived links that match the filters.
+    output_path(out_dir, outfile, link):
+        Returns where the calendar of one document is written.
+    Checkpoint(path):
+        The outcome of every document processed so far, saved after each one.
+    reprocess(jobs, out_dir, checkpoint, max_workers):
+        Downloads and parses a batch of documents, writing each calendar as soon as it is ready.
+    archive_outputs(jobs, checkpoint, archive):
+        Merges the calendars of a run into the month archive.
+    summarize(jobs, checkpoint, seconds):
+        Builds the summary report of a run.
+Usage:
+    python reprocess.py [--level k12] [--meal lunch] [--language es] [--month 2025-04]
+                        [--out reprocessed] [--workers 8] [--retry-failed] [--restart] [--archive]
+'''
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import metrics
+import pdf_2_ics
+from atomic_file import atomic_write_json, atomic_write_text
+from menu_calendar import read_events
+
+# Where the calendar of each reprocessed document is written, with the checkpoint of the run
+OUT_DIR = os.environ.get("DPS_REPROCESS_DIR", "reprocessed")
+# Summary of the run, written at the end
+REPORT_JSON = os.environ.get("DPS_REPROCESS_REPORT", "reprocess_report.json")
+
+
+def select_jobs(links, levels=(), meals=(), languages=(), months=(), store=None):
+    """
+    Builds the generate_ics() jobs for the archived links that are menus and match every filter given.
+    The date hint of each job is the one recorded in the store when the link was first processed,
+    which also knew the listing page it was found on, or else the one its filename gives.
+    Args:
+        links (list): The document links, e.g. LinkStore.links().
+        levels (iterable): School levels to keep, e.g. "k12", "middle". Empty keeps every level.
+        meals (iterable): Meals to keep, e.g. "lunch". Empty keeps every meal.
+        languages (iterable): Languages to keep, "en" or "es". Empty keeps both.
+        months (iterable): Months to keep, as "YYYY-MM". Links whose month is unknown never match.
+        store (LinkStore): Where the recorded date hints are looked up, if given.
+    Returns:
+        list: A list of (filename, level, language, day_language, meal, date_hint) tuples, as passed to
+        generate_ics().
+    """
+    jobs = []
+    for link in links:
+        if not pdf_2_ics.clean_link(link).endswith((".pdf", ".docx")):
+            continue
+        params = pdf_2_ics.parse_filename(link)
+        if not params or not pdf_2_ics.menu_target(*params):
+            continue
+        (level, language, meal) = params
+        if (levels and level not in levels) or (meals and meal not in meals) or (languages and language not in languages):
+            continue
+        hint = (store.date_hint(link) if store is not None else None) or pdf_2_ics.document_date_hint(link)
+        if months and (hint is None or "%04d-%02d" % hint not in months):
+            continue
+        jobs.append((link, level, language, language, meal, hint))
+    return jobs
+
+
+def output_path(out_dir, outfile, link):
+    """
+    Returns where the calendar of one document is written: in a folder per calendar, named after the
+    document and the asset folder it was uploaded to, since the same filename is reused across months.
+    Args:
+        out_dir (str): The output directory.
+        outfile (str): The calendar's ICS filename, from menu_target().
+        link (str): The document link.
+    Returns:
+        str: The path of the ICS file.
+    """
+    parts = pdf_2_ics.clean_link(link).split("?")[0].split("/")
+    return os.path.join(out_dir, os.path.splitext(outfile)[0], f"{parts[-2]}_{parts[-1]}.ics")
+
+
+class Checkpoint:
+    """
+    The outcome of every document processed so far, kept in a JSON file.
+
+    Each link maps to its status ("ok" or "failed"), output file, number of events, SHA-256 and
+    error. The file is rewritten after every document, atomically, so a run that is stopped
+    halfway can be resumed without redoing the documents it finished. It is safe to use from
+    several threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self._entries = json.load(f)
+        else:
+            self._entries = {}
+
+    def get(self, link):
+        """
+        Returns the recorded outcome of a link, or None if it has not been processed.
+        """
+        with self._lock:
+            return self._entries.get(link)
+
+    def entries(self):
+        """
+        Returns:
+            dict: A copy of every recorded outcome, by link.
+        """
+        with self._lock:
+            return dict(self._entries)
+
+    def record(self, link, status, **details):
+        """
+        Records the outcome of a document and saves the checkpoint.
+        Args:
+            link (str): The document link.
+            status (str): "ok" or "failed".
+            details: Other fields to store, e.g. outfile, events, sha256, error.
+        """
+        with self._lock:
+            self._entries[link] = dict(details, status=status)
+            atomic_write_json(self.path, self._entries, indent=1, sort_keys=True)
+
+
+def reprocess(jobs, out_dir=OUT_DIR, checkpoint=None, max_workers=None):
+    """
+    Downloads and parses a batch of documents, writing the calendar of each one as soon as it is ready.
+    Downloads run in a thread pool and parsing in a process pool with one worker per CPU core by
+    default. At most 2 * max_workers documents are downloaded or being parsed at once, so memory does
+    not grow with the archive. A document that fails to download or parse is recorded as failed and
+    the run goes on.
+    Args:
+        jobs (list): The jobs, from select_jobs().
+        out_dir (str): The output directory.
+        checkpoint (Checkpoint): Where the outcome of each document is recorded.
+        max_workers (int): The number of documents downloaded, and parsed, at the same time.
+    Returns:
+        None
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as parse_pool:
+        waiting = iter(jobs)
+        pending = {}
+
+        def start_next():
+            job = next(waiting, None)
+            if job is not None:
+                pending[fetch_pool.submit(pdf_2_ics.fetch_document, pdf_2_ics.clean_link(job[0]))] = ("fetch", job, None)
+
+        for _ in range(2 * max_workers):
+            start_next()
+        done_count = 0
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                (stage, job, digest) = pending.pop(future)
+                (filename, level, language, day_language, meal, date_hint) = job
+                (event_title, outfile) = pdf_2_ics.menu_target(level, language, meal)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Failed {filename}: {e}")
+                    checkpoint.record(filename, "failed", outfile=outfile, error=f"{stage}: {e}")
+                    start_next()
+                    continue
+                if stage == "fetch":
+                    # start parsing each document as soon as its download finishes
+                    parse = parse_pool.submit(
+                        pdf_2_ics.document_to_ics_with_metrics, pdf_2_ics.clean_link(filename), result, event_title,
+                        language, day_language, outfile, date_hint
+                    )
+                    pending[parse] = ("parse", job, hashlib.sha256(result).hexdigest())
+                    continue
+                (ics_string, snapshot) = result
+                metrics.get_metrics().merge(snapshot)
+                path = output_path(out_dir, outfile, filename)
+                atomic_write_text(path, ics_string, newline="")
+                checkpoint.record(filename, "ok", outfile=outfile, path=path, sha256=digest,
+                                  events=ics_string.count("BEGIN:VEVENT"))
+                done_count += 1
+                print(f"[{done_count}/{len(jobs)}] {path}")
+                start_next()
+
+
+def archive_outputs(jobs, checkpoint, archive):
+    """
+    Merges the calendar of every document processed successfully into the month archive, in the
+    order of jobs, so that when two documents cover the same day the later link wins.
+    Args:
+        jobs (list): The jobs of the run, including the ones skipped because they were already done.
+        checkpoint (Checkpoint): The outcomes of the documents.
+        archive (CalendarArchive): The archive, e.g. pdf_2_ics.get_calendar_archive().
+    Returns:
+        int: The number of month segments rewritten.
+    """
+    written = 0
+    for job in jobs:
+        entry = checkpoint.get(job[0])
+        if not entry or entry["status"] != "ok":
+            continue
+        with open(entry["path"], "r", newline="", encoding="utf-8") as f:
+            written += len(archive.merge(entry["outfile"], read_events(f.read())))
+    return written
+
+
+def summarize(jobs, checkpoint, seconds):
+    """
+    Builds the summary report of a run.
+    Args:
+        jobs (list): The jobs of the run, including the ones skipped because they were already done.
+        checkpoint (Checkpoint): The outcomes of the documents.
+        seconds (float): How long the run took.
+    Returns:
+        dict: The document and event counts, overall and per calendar, the failures and the stage timings.
+    """
+    entries = checkpoint.entries()
+    calendars = {}
+    failures = []
+    totals = {"documents": len(jobs), "ok": 0, "failed": 0, "missing": 0, "events": 0}
+    for job in jobs:
+        entry = entries.get(job[0])
+        if entry is None:
+            totals["missing"] += 1
+            continue
+        calendar = calendars.setdefault(entry["outfile"], {"ok": 0, "failed": 0, "events": 0})
+        calendar[entry["status"]] += 1
+        totals[entry["status"]] += 1
+        if entry["status"] == "ok":
+            calendar["events"] += entry["events"]
+            totals["events"] += entry["events"]
+        else:
+            failures.append({"link": job[0], "error": entry.get("error")})
+    return {
+        "seconds": seconds,
+        "totals": totals,
+        "calendars": calendars,
+        "failures": failures,
+        "stages": metrics.get_metrics().report()["stages"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate the ICS output of archived menus.")
+    parser.add_argument("--level", action="append", default=[], help="keep this school level (repeatable)")
+    parser.add_argument("--meal", action="append", default=[], help="keep this meal (repeatable)")
+    parser.add_argument("--language", action="append", default=[], help="keep this language, en or es (repeatable)")
+    parser.add_argument("--month", action="append", default=[], help="keep this month, as YYYY-MM (repeatable)")
+    parser.add_argument("--out", default=OUT_DIR, help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="documents processed at the same time (default: CPU cores)")
+    parser.add_argument("--retry-failed", action="store_true", help="process the documents that failed last time again")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and process every document")
+    parser.add_argument("--archive", action="store_true", help="merge the calendars into the month archive afterwards")
+    args = parser.parse_args()
+
+    store = pdf_2_ics.LinkStore()
+    store.import_json()
+    jobs = select_jobs(store.links(), args.level, args.meal, args.language, args.month, store)
+
+    checkpoint_path = os.path.join(args.out, "checkpoint.json")
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path)
+    resume_statuses = ("ok",) if args.retry_failed else ("ok", "failed")
+    todo = [job for job in jobs if (checkpoint.get(job[0]) or {}).get("status") not in resume_statuses]
+    print(f"{len(jobs)} documents selected, {len(jobs) - len(todo)} already done, {len(todo)} to process")
+
+    start = time.perf_counter()
+    if todo:
+        reprocess(todo, args.out, checkpoint, args.workers)
+    report = summarize(jobs, checkpoint, time.perf_counter() - start)
+    atomic_write_json(REPORT_JSON, report, indent=1)
+    totals = report["totals"]
+    print(f"{totals['ok']} ok, {totals['failed']} failed, {totals['missing']} missing, {totals['events']} events")
+    if args.archive and pdf_2_ics.get_calendar_archive() is not None:
+        written = archive_outputs(jobs, checkpoint, pdf_2_ics.get_calendar_archive())
+        print(f"{written} archive months rewritten in {pdf_2_ics.ARCHIVE_DIR}")